@@ -11,8 +11,18 @@ char clientId[50];
 // MQTT
 const char *mqtt_server = "test.mosquitto.org";
 const int mqtt_port = 1883;
-const char *action_topic = "adaptative-pedal/actions";
-const char *settings_topic = "adaptative-pedal/toggle-piano";
+// Con main.py --sessions cada casco usa adaptative-pedal/<source_id>/...: compilar
+// con -D PEDAL_SESSION=\"<source_id>\" (platformio.ini) para seguir a ese casco
+#ifdef PEDAL_SESSION
+#define TOPIC_BASE "adaptative-pedal/" PEDAL_SESSION
+#else
+#define TOPIC_BASE "adaptative-pedal"
+#endif
+const char *action_topic = TOPIC_BASE "/actions";
+const char *settings_topic = TOPIC_BASE "/toggle-piano";
+const char *celestina_topic = TOPIC_BASE "/celestina";
+const char *sostenuto_topic = TOPIC_BASE "/sostenuto";
+const char *sustain_topic = TOPIC_BASE "/sustain";
 
 // Pines de salida
 const int pinCelestino = 27;
@@ -52,26 +62,85 @@ void setup_wifi()
   }
 }
 
-void toggleCelestino()
+// Protocolo binario: version | codigo | arranque del emisor (uint16 LE) | secuencia (uint16 LE) | tiempo ms (uint32 LE)
+#define BINARY_VERSION 0xA2
+#define BINARY_SIZE 10
+#define SET_CELESTINO_ON 1
+#define SET_CELESTINO_OFF 2
+#define SET_SOSTENUTO_ON 3
+#define SET_SOSTENUTO_OFF 4
+uint16_t lastBoot = 0;
+uint16_t lastSeq = 0;
+bool hasSeq = false;
+
+void setCelestino(bool estado)
 {
-  estadoCelestino = !estadoCelestino;
+  estadoCelestino = estado;
   if (isDigital) {
     digitalWrite(pinCelestino, estadoCelestino ? HIGH : LOW);
   } else {
     servo_celestina.write(estadoCelestino ? ON_SERVO_ANGLE : OFF_SERVO_ANGLE);
   }
-  client.publish("adaptative-pedal/celestina", estadoCelestino ? "true" : "false");
+  // Retenido: el emisor recupera el estado al conectarse
+  client.publish(celestina_topic, estadoCelestino ? "true" : "false", true);
 }
 
-void toggleSostenuto()
+void toggleCelestino()
+{
+  setCelestino(!estadoCelestino);
+}
+
+void setSostenuto(bool estado)
 {
-  estadoSostenuto = !estadoSostenuto;
+  estadoSostenuto = estado;
   if (isDigital){
     digitalWrite(pinSostenuto, estadoSostenuto ? HIGH : LOW);
   } else {
     servo_sostenuto.write(estadoSostenuto ? ON_SERVO_ANGLE : OFF_SERVO_ANGLE);
   }
-  client.publish("adaptative-pedal/sostenuto", estadoSostenuto ? "true" : "false");
+  client.publish(sostenuto_topic, estadoSostenuto ? "true" : "false", true);
+}
+
+void toggleSostenuto()
+{
+  setSostenuto(!estadoSostenuto);
+}
+
+bool handle_binary(byte *payload, unsigned int length)
+{
+  if (length != BINARY_SIZE || payload[0] != BINARY_VERSION)
+  {
+    return false;
+  }
+  uint16_t boot = payload[2] | (payload[3] << 8);
+  uint16_t seq = payload[4] | (payload[5] << 8);
+  // Descarta paquetes repetidos o desordenados del mismo arranque, un emisor
+  // reiniciado trae otro identificador y empieza su secuencia de nuevo
+  int16_t diff = (int16_t)(seq - lastSeq);
+  if (hasSeq && boot == lastBoot && diff <= 0)
+  {
+    return true;
+  }
+  lastBoot = boot;
+  lastSeq = seq;
+  hasSeq = true;
+
+  switch (payload[1])
+  {
+  case SET_CELESTINO_ON:
+    setCelestino(true);
+    break;
+  case SET_CELESTINO_OFF:
+    setCelestino(false);
+    break;
+  case SET_SOSTENUTO_ON:
+    setSostenuto(true);
+    break;
+  case SET_SOSTENUTO_OFF:
+    setSostenuto(false);
+    break;
+  }
+  return true;
 }
 
 void setSustain() 
@@ -82,7 +151,7 @@ void setSustain()
   else {
     servo_sustain.write(estadoSustain ? ON_SERVO_ANGLE : OFF_SERVO_ANGLE);
   }
-  client.publish("adaptative-pedal/sustain", estadoSustain ? "true" : "false");
+  client.publish(sustain_topic, estadoSustain ? "true" : "false");
 }
 
 void handle_sustain_detection() {
@@ -113,6 +182,10 @@ void handle_sustain_detection() {
 
 void callback(char *topic, byte *payload, unsigned int length)
 {
+  if (handle_binary(payload, length))
+  {
+    return;
+  }
   String message = "";
   for (unsigned int i = 0; i < length; i++)
   {
@@ -173,6 +246,9 @@ void reconnect()
     {
       client.subscribe(action_topic);
       client.subscribe(settings_topic);
+      // Estado actual para el emisor, tambien tras un reinicio de la placa
+      client.publish(celestina_topic, estadoCelestino ? "true" : "false", true);
+      client.publish(sostenuto_topic, estadoSostenuto ? "true" : "false", true);
       Serial.print(clientId);
       Serial.println(" connected");
     }
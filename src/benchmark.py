@@ -0,0 +1,245 @@
+from time import perf_counter
+import numpy as np
+import argparse
+import resource
+import subprocess
+import sys
+import main
+from modules.muse_stream import MuseStream
+from modules.recording import ReplayInlet
+from modules.synthetic import SyntheticInlet
+from modules.settings import Settings
+from modules.metrics import registry
+
+
+class TimedInlet:
+    def __init__(self, inlet):
+        self.inlet = inlet
+        self.pulled_at = None
+        self.last_timestamp = None
+        self.n_samples = 0
+        # * Time between a chunk being returned and the next pull, i.e. processing
+        self.chunk_times = []
+
+    def info(self):
+        return self.inlet.info()
+
+    def time_correction(self, *args, **kwargs):
+        return self.inlet.time_correction(*args, **kwargs)
+
+    def samples_available(self):
+        return self.inlet.samples_available()
+
+    @property
+    def finished(self):
+        return self.inlet.finished
+
+    def pull_chunk(self, timeout: float = 0.0, max_samples: int = 1024):
+        now = perf_counter()
+        if self.pulled_at is not None:
+            self.chunk_times.append(now - self.pulled_at)
+            self.pulled_at = None
+        samples, timestamps = self.inlet.pull_chunk(timeout=timeout, max_samples=max_samples)
+        if timestamps:
+            self.pulled_at = perf_counter()
+            self.last_timestamp = timestamps[-1]
+            self.n_samples += len(timestamps)
+        return samples, timestamps
+
+
+class LocalMessage:
+    def __init__(self, mid: int):
+        self.mid = mid
+        self.rc = 0
+
+
+class LocalClient:
+    # * Stand-in for the paho client, keeps what would have been published and
+    # * acknowledges it right away
+    def __init__(self, inlet: TimedInlet):
+        self.inlet = inlet
+        self.published = []
+
+    def connect(self, host, port, keepalive):
+        self.on_connect(self, None, None, 0, None)
+
+    def reconnect_delay_set(self, min_delay, max_delay):
+        pass
+
+    def loop_start(self):
+        pass
+
+    def subscribe(self, topic):
+        pass
+
+    def socket(self):
+        return None
+
+    def publish(self, topic, payload, *args, **kwargs):
+        # * Latency = sample time until the chunk was available + processing time
+        processing = perf_counter() - self.inlet.pulled_at
+        self.published.append((payload, self.inlet.last_timestamp, processing))
+        message = LocalMessage(len(self.published))
+        self.on_publish(self, None, message.mid, 0, None)
+        return message
+
+
+def match_gestures(gestures, published, max_delay: float = 1.0):
+    latencies = []
+    missed = 0
+    remaining = list(published)
+    for onset, action in gestures:
+        match = None
+        for item in remaining:
+            payload, timestamp, processing = item
+            if payload == action and 0 <= timestamp - onset <= max_delay:
+                match = item
+                break
+        if match is None:
+            missed += 1
+            continue
+        remaining.remove(match)
+        latencies.append(match[1] - onset + match[2])
+    return np.array(latencies), missed, len(remaining)
+
+
+def match_reversals(reversals, detections, max_delay: float = 0.5):
+    # * Aborted nods that fired a toggle, and how many of those were undone
+    fired = cancelled = 0
+    for onset, action in reversals:
+        near = [cancel for a, t, cancel in detections if a == action and 0 <= t - onset <= max_delay]
+        fired += near.count(False) > 0
+        cancelled += near.count(False) > 0 and near.count(True) >= near.count(False)
+    return fired, cancelled
+
+
+def percentiles(values, scale: float = 1e3):
+    if len(values) == 0:
+        return "n/a"
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) * scale
+    return f"p50 {p50:.3f}  p95 {p95:.3f}  p99 {p99:.3f}"
+
+
+# * Sensor noise std of the synthetic sessions, typical and noisy
+NOISE = 2.0
+NOISY = 6.0
+
+STARTUP_PROBE = """
+from time import perf_counter
+import resource
+started = perf_counter()
+{imports}
+print(perf_counter() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+STARTUP_CASES = {
+    "headless": "import main",
+    "viewer": "import main\nimport matplotlib.pyplot\nimport modules.lsl_viewer",
+}
+
+
+def startup(repeat: int):
+    # * Every run is a fresh interpreter, the probe reports the import time of
+    # * the entry point and the peak RSS once it is loaded
+    for name, imports in STARTUP_CASES.items():
+        times, rss = [], []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", STARTUP_PROBE.format(imports=imports)],
+                capture_output=True, text=True, check=True,
+            ).stdout.split()
+            times.append(float(output[-2]))
+            rss.append(int(output[-1]) / 1024)
+        print(f"Startup [{name}]: import (ms) {percentiles(times)}, peak RSS {np.median(rss):.1f} MB")
+
+
+def run(args, noise: float = None, reversals: bool = False):
+    if args.metrics:
+        registry.enable()
+    if args.replay:
+        source = ReplayInlet(args.replay, "GYRO", realtime=args.realtime)
+        gestures = []
+    else:
+        source = SyntheticInlet(args.duration, realtime=args.realtime, seed=args.seed, noise=noise, reversals=reversals)
+        gestures = source.gestures
+        print(f"Synthetic session, sensor noise std {noise}{', with aborted nods' if reversals else ''}")
+    inlet = TimedInlet(source)
+    client = LocalClient(inlet)
+    mqtt_conn = main.MQTTConection(main.SETTINGS_TOPIC, "localhost", 1883, 60, Settings(), client=client)
+
+    gyro_stream = MuseStream(source.info(), args.filter, 1, args.window, inlet=inlet)
+    gyro = main.Gyro(gyro_stream, mqtt_conn, predictive=args.predictive)
+    gyro.calibrate()
+
+    # * Sample time of every detection, the latency without chunking effects
+    detected = []
+    cancels = []
+    process = gyro.process
+
+    def recording_process(samples, timestamps):
+        detections = process(samples, timestamps)
+        detected.extend((d.action, d.timestamp, 0.0) for d in detections if not d.cancel)
+        cancels.extend((d.action, d.timestamp, d.cancel) for d in detections)
+        return detections
+
+    gyro.process = recording_process
+
+    inlet.chunk_times = []
+    n_start = inlet.n_samples
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started_at = perf_counter()
+    gyro.detect()
+    elapsed = perf_counter() - started_at
+    rss_end = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    n_samples = inlet.n_samples - n_start
+    print(f"Samples: {n_samples} in {elapsed:.2f} s ({n_samples / elapsed:.0f} samples/s)")
+    print(f"Chunks: {len(inlet.chunk_times)}")
+    print(f"Chunk processing (ms): {percentiles(inlet.chunk_times)}")
+    print(f"Published actions: {len(client.published)} ({gyro.cancelled} cancellations)")
+    if gestures:
+        latencies, missed, extra = match_gestures(gestures, client.published)
+        print(f"Gestures: {len(gestures)}, detected {len(latencies)}, missed {missed}, false {extra}")
+        print(f"Gesture to publish (ms): {percentiles(latencies)}")
+        latencies, _, _ = match_gestures(gestures, detected)
+        print(f"Gesture to detection (ms): {percentiles(latencies)}")
+    if reversals:
+        # * A fired and cancelled toggle publishes twice, counted as false above
+        fired, cancelled = match_reversals(source.reversals, cancels)
+        print(f"Aborted nods: {len(source.reversals)}, fired {fired}, cancelled {cancelled}, left toggled {fired - cancelled}")
+    print(f"Peak RSS growth: {(rss_end - rss_start) / 1024:.1f} MB")
+    if args.metrics:
+        print(registry.to_prometheus())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the detection pipeline")
+    parser.add_argument("--replay", help="folder of a recorded session, synthetic data otherwise")
+    parser.add_argument("--duration", type=float, default=600, help="synthetic session length (s)")
+    parser.add_argument("--window", type=int, default=10)
+    parser.add_argument("--realtime", action="store_true", help="pace samples at the recorded rate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--filter", action="store_true", help="run the gyro processing chain")
+    parser.add_argument("--metrics", action="store_true", help="enable instrumentation and print it")
+    parser.add_argument("--predictive", action="store_true", help="use the onset-predictive detector")
+    parser.add_argument(
+        "--noise", type=float, nargs="+",
+        help=f"sensor noise std of the synthetic sessions, one run each (default {NOISE}, also {NOISY} with --predictive)",
+    )
+    parser.add_argument("--reversals", action="store_true", help="only run synthetic sessions with aborted nods")
+    parser.add_argument("--startup", type=int, metavar="N", help="only measure startup over N fresh interpreters")
+    args = parser.parse_args()
+    if args.startup:
+        startup(args.startup)
+    elif args.replay:
+        run(args)
+    else:
+        # * The predictive detector is also run on a noisier still head and with
+        # * aborted nods, where a provisional toggle is fired and cancelled
+        noises = args.noise or ([NOISE, NOISY] if args.predictive else [NOISE])
+        if not args.reversals:
+            for noise in noises:
+                run(args, noise)
+        if args.reversals or args.predictive:
+            for noise in noises:
+                run(args, noise, reversals=True)
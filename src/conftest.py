@@ -0,0 +1 @@
+# * Lets the tests import `modules` the same way the entry scripts do
@@ -1,23 +1,53 @@
-from pylsl import resolve_streams
-from time import sleep, time
 import numpy as np
-import matplotlib.pyplot as plt
 from modules.muse_stream import MuseStream
-from modules.constants import LSL_EEG_CHUNK, SETTINGS_TOPIC, ACTIONS_TOPIC, TOGGLE_CELESTINO, TOGGLE_SOSTENUTO, DEFAULT_THRESHOLD
-from modules.lsl_viewer import LSLViewer
+from modules.constants import SETTINGS_TOPIC, ACTIONS_TOPIC, MQTT_HOST, MQTT_PORT, DEFAULT_QOS, BINARY_QOS, RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY, TOGGLE_CELESTINO, TOGGLE_SOSTENUTO, GYRO_AXIS, METRICS_DUMP_PERIOD, GAP_SETTLE, SESSION_SCAN_PERIOD, DEFAULT_NOISE_FACTOR
+from modules.gesture_detector import GestureDetector
+from modules.predictive import PredictiveDetector
+from modules.calibrator import Calibrator
+from modules.threshold import AdaptiveThreshold, FIXED, ADAPTIVE
+from modules.recording import ReplayInlet
+from modules.discovery import Discovery, StreamWatcher
+from modules.sessions import SessionServer, session_id
+from modules.gaps import GapTracker
+from modules.acquisition import Acquisition, ChunkQueue
+from modules.settings import Settings
+from modules.publisher import ActionPublisher
+from modules.protocol import BinaryProtocol
+from modules.metrics import registry
+from modules import async_runtime
+from threading import Thread
 import paho.mqtt.client as mqtt
-import json
+from time import perf_counter, sleep
+from functools import partial
+import argparse
+import os
+import asyncio
 
-threshold = DEFAULT_THRESHOLD
-calibrate = False
+def mqtt_client(client_id: str = None):
+    # * paho resends unacked QoS 1/2 actions after a reconnect either way. The
+    # * broker only keeps a session for a configured, stable client id: a new id
+    # * per run would leave an orphan session behind every time, also on the
+    # * public default broker
+    if client_id:
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, clean_session=False)
+    return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, clean_session=True)
 
 class MQTTConection:
-    def __init__(self, adj_topic, host, port, keepalive):
+    def __init__(self, adj_topic, host, port, keepalive, settings: Settings, client=None, qos: int = DEFAULT_QOS, binary: bool = False, client_id: str = None):
         self.adj_topic = adj_topic
+        self.settings = settings
 
-        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        # * A client can be injected to run without a broker (benchmarks)
+        if client is None:
+            client = mqtt_client(client_id)
+        self.client = client
+        protocol = BinaryProtocol() if binary else None
+        self.publisher = ActionPublisher(self.client, ACTIONS_TOPIC, qos, protocol)
         self.client.on_message = self.on_message
         self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_publish = self.on_publish
+        self.client.reconnect_delay_set(min_delay=RECONNECT_MIN_DELAY, max_delay=RECONNECT_MAX_DELAY)
         self.client.connect(host, port, keepalive)
 
     def start(self):
@@ -27,150 +57,327 @@ class MQTTConection:
     def on_connect(self, client, userdata, flags, reason_code, properties):
         print(f"Connected with result code {reason_code}")
         self.client.subscribe(self.adj_topic)
+        self.publisher.on_connect(client)
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties):
+        print(f"Disconnected with result code {reason_code}")
+        self.publisher.on_disconnect()
+
+    def on_publish(self, client, userdata, mid, reason_code, properties):
+        self.publisher.on_publish(mid)
 
     def on_message(self, client, userdata, msg):
-        global calibrate
-        global threshold
-        payload = json.loads(msg.payload.decode())
-
-        if msg.topic == self.adj_topic and payload["action"] == "CHANGE_THRESHOLD":
-            print(f"✅ Threshold changed to {payload["value"]}")
-            threshold = int(payload["value"])
-        elif msg.topic == self.adj_topic and payload["action"] == "DEFAULT_THRESHOLD":
-            print(f"✅ Threshold changed to default value {DEFAULT_THRESHOLD}")
-        elif msg.topic == self.adj_topic and payload["action"] == "CALIBRATE":
-            print(f"⚙️  Calibrating")
-            calibrate = True
+        if self.publisher.on_state(msg.topic, msg.payload) or msg.topic != self.adj_topic:
+            return
+        self.settings.handle(msg.payload)
 
     def publish_action(self, action):
-        self.client.publish(ACTIONS_TOPIC, action)
+        self.publisher.publish(action)
 
 class Gyro:
-    def __init__(self, gyro_stream: MuseStream, mqtt_conn: MQTTConection, ax):
+    def __init__(self, gyro_stream: MuseStream, mqtt_conn: MQTTConection, queue: ChunkQueue = None, labels: dict = None, predictive: bool = False):
         self.gyro_stream = gyro_stream
-        self.gyro_stream.setup_ax(ax)
         self.startef = False    
         self.mqtt_conn = mqtt_conn
+        self.settings = mqtt_conn.settings
+        self.mean = None
+        # * With a queue the chunks come from an Acquisition thread, otherwise
+        # * they are pulled from the inlet here
+        self.queue = queue
+        # * The predictive detector fires at the onset and may cancel afterwards
+        self.detector = PredictiveDetector() if predictive else GestureDetector()
+        self.cancelled = 0
+        self.calibrator = Calibrator(gyro_stream.n_chan)
+        self.threshold = AdaptiveThreshold(gyro_stream.sfreq)
+        self.gaps = GapTracker(gyro_stream.sfreq)
+
+        # * Extra metric labels, e.g. the session when several headsets share a process
+        labels = labels or {}
+        self.metered = registry.enabled
+        self.processing = registry.histogram("pedal_chunk_processing_seconds", "Detection time per chunk", labels)
+        self.detections = {
+            action: registry.counter("pedal_detections_total", "Pedal toggles detected", {**labels, "action": action})
+            for action in (TOGGLE_CELESTINO, TOGGLE_SOSTENUTO)
+        }
+        self.cancellations = registry.counter("pedal_cancelled_total", "Predictive toggles undone on reversal", labels)
+        self.offsets = [
+            registry.gauge("pedal_calibration_offset", "Calibration offset per channel", {**labels, "channel": ii})
+            for ii in range(gyro_stream.n_chan)
+        ]
+        self.noise = [
+            registry.gauge("pedal_window_std", "Std of each channel over the stream window", {**labels, "channel": ii})
+            for ii in range(gyro_stream.n_chan)
+        ]
 
     def calibrate(self):
+        # * Blocking calibration, used before detection starts
         print("Calibrating...")
-        time_diff = 0
-        data = np.zeros((self.gyro_stream.n_samples, self.gyro_stream.n_chan))
-        while (time_diff < 5):
-            samples, timestamps = self.gyro_stream.inlet.pull_chunk(timeout=0.5, max_samples=LSL_EEG_CHUNK)
-            data = np.vstack([data, samples])
-            time_diff += 0.5
-        self.mean = np.mean(data, axis=0)
+        self.calibrator.start()
+        while self.calibrator.running and not self.exhausted:
+            samples, timestamps = self.next_chunk(timeout=0.5)
+            if self.calibrator.update(samples, timestamps):
+                self.apply_calibration()
+
+    def next_chunk(self, timeout: float = 0.1):
+        if self.queue is not None:
+            return self.queue.get(timeout=timeout)
+        return self.gyro_stream.pull(timeout=timeout)
+
+    @property
+    def exhausted(self):
+        return self.gyro_stream.finished and (self.queue is None or len(self.queue) == 0)
+
+    def apply_calibration(self):
+        self.mean = self.calibrator.mean
+        self.std = self.calibrator.std
+        self.threshold.calibrate(self.mean[GYRO_AXIS], self.std[GYRO_AXIS])
+        if isinstance(self.detector, PredictiveDetector):
+            self.detector.calibrate(self.std[GYRO_AXIS])
         print("Calibration offset:", self.mean)
+        print("Calibration noise:", self.std)
+        for ii, offset in enumerate(self.offsets):
+            offset.set(self.mean[ii])
+        if self.gyro_stream.shared is not None:
+            self.gyro_stream.shared.set_offsets(self.mean)
+
+    def process(self, samples, timestamps):
+        if self.metered:
+            started = perf_counter()
+            detections = self.detect_chunk(samples, timestamps)
+            self.processing.observe(perf_counter() - started)
+            for ii, std in enumerate(self.gyro_stream.window_std(filtered=False)):
+                self.noise[ii].set(std)
+            for detection in detections:
+                if detection.cancel:
+                    self.cancellations.inc()
+                else:
+                    self.detections[detection.action].inc()
+            return detections
+        return self.detect_chunk(samples, timestamps)
+
+    def detect_chunk(self, samples, timestamps):
+        # * Settings from MQTT are applied here, between two chunks
+        self.settings.apply()
+        if self.settings.take_calibrate():
+            # * Calibrate in the background, detection keeps the previous offset
+            print("Calibrating...")
+            self.calibrator.start()
+
+        if self.calibrator.update(samples, timestamps):
+            self.apply_calibration()
+        if self.mean is None:
+            return []
+
+        missing = self.gaps.check(timestamps)
+        if missing and self.gaps.is_long(missing):
+            # * After a dropout the first samples jump from wherever the head
+            # * was, start over and let the signal settle before firing
+            print(f"⚠️  Gap of {missing} samples, detector reset")
+            self.detector.reset()
+            self.detector.hold(timestamps[0] + GAP_SETTLE)
+
+        # * Only the new samples of channel Y are checked, whole chunk at once.
+        # * Debounce runs on the LSL clock of the samples
+        values = np.asarray(samples)[:, GYRO_AXIS]
+        if self.settings.threshold_mode == ADAPTIVE:
+            self.threshold.noise_factor = self.settings.noise_factor
+            values = self.threshold.update(values)
+            level = self.threshold.level
+        else:
+            values = values - self.mean[GYRO_AXIS]
+            level = self.settings.threshold
+        detections = self.detector.update_chunk(values, timestamps, level)
+        for detection in detections:
+            if detection.cancel:
+                # * Publishing the same toggle again undoes it, if the first one
+                # * is still queued the publisher drops both
+                self.cancelled += 1
+                print(f"↩️  Cancelled {detection.action}")
+            elif detection.action == TOGGLE_CELESTINO:
+                print("☁️  Toggled celestino pedal")
+            else:
+                print("〰️ Toggled sostenuto pedal")
+        return detections
 
     def detect(self):
-        global threshold
-        global calibrate
         self.started = True
-        last_down = 0
-        last_up = 0
         try:
             while self.started:
-                if calibrate:
-                    sleep(1)
-                    self.calibrate()
-                    calibrate = False
-                    
-                muse_stream = self.gyro_stream
-                samples, timestamps = self.gyro_stream.inlet.pull_chunk(
-                    timeout=0.1, max_samples=LSL_EEG_CHUNK
-                )
-                if timestamps:
-                    timestamps = np.float64(np.arange(len(timestamps)))
-                    timestamps /= muse_stream.sfreq
-                    timestamps += muse_stream.times[-1] + 1.0 / muse_stream.sfreq
-
-                    muse_stream.n_samples = int(muse_stream.sfreq * muse_stream.window)
-                    muse_stream.times = muse_stream.times[-muse_stream.n_samples :]
-
-                    muse_stream.data = np.vstack([muse_stream.data, samples])
-                    muse_stream.data = muse_stream.data[-muse_stream.n_samples :]
-                    plot_data = muse_stream.data - self.mean
-
-                    for ii in range(muse_stream.n_chan):
-                        if muse_stream.type == "GYRO":
-                            # print(
-                            #     f"{muse_stream.ch_names[ii]}:",
-                            #     plot_data[-1, ii],
-                            #     end=" ",
-                            # )
-                            if ii == 2:
-                                # print("")
-                                # * Select channel Y (1)
-                                if (
-                                    plot_data[-1, 1] > threshold
-                                    and time() - last_up > 1
-                                ):
-                                    self.mqtt_conn.publish_action(TOGGLE_CELESTINO)
-                                    print("☁️  Toggled celestino pedal")
-                                    last_down = time()
-                                    sleep(0.3)
-                                elif (
-                                    plot_data[-1, 1] < -threshold
-                                    and time() - last_down > 1
-                                ):
-                                    self.mqtt_conn.publish_action(TOGGLE_SOSTENUTO)
-                                    last_up = time()
-                                    print("〰️ Toggled sostenuto pedal")
-                                    sleep(0.3)
-
-                        # muse_stream.lines[ii].set_xdata(
-                        #     muse_stream.times[:: muse_stream.subsample]
-                        #     - muse_stream.times[-1]
-                        # )
-                        # muse_stream.lines[ii].set_ydata(
-                        #     plot_data[:: muse_stream.subsample, ii]
-                        #     / muse_stream.scale
-                        #     - 0
-                        # )
-                        # impedances = np.std(plot_data, axis=0)
-                        # ticks_labels = [
-                        #     "%s - %.2f" % (muse_stream.ch_names[ii], impedances[ii])
-                        #     for ii in range(muse_stream.n_chan)
-                        # ]
-                        # muse_stream.axes.set_yticklabels(ticks_labels)
-                        # muse_stream.axes.set_xlim(-muse_stream.window, 0)
-                        # self.fig.canvas.draw()
+                samples, timestamps = self.next_chunk(timeout=0.1)
+                if len(timestamps):
+                    for detection in self.process(samples, timestamps):
+                        self.mqtt_conn.publish_action(detection.action)
+                elif self.exhausted:
+                    # * A replayed session has no more samples
+                    self.started = False
             print("End")
         except RuntimeError as e:
             raise
 
+def start_settings(args):
+    # * Settings a run starts with, MQTT can still change them later
+    return Settings(threshold_mode=args.threshold_mode, noise_factor=args.noise_factor)
+
+def run_sessions(args):
+    # * Every headset found gets its own session (topics, settings, calibration)
+    # * on one MQTT client, new headsets are picked up while running
+    client = mqtt_client(args.client_id)
+    server = SessionServer(
+        client, partial(Gyro, predictive=args.predictive), qos=args.qos, binary=args.binary, make_settings=partial(start_settings, args)
+    )
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+    discovery = Discovery()
+    watchers = []
+    try:
+        while True:
+            for stream in discovery.resolve_all("GYRO"):
+                if session_id(stream) in server:
+                    continue
+                muse_stream = MuseStream(stream, args.filter, 1, 10, labels={"session": session_id(stream)})
+                server.add(muse_stream)
+                watcher = StreamWatcher(muse_stream, discovery, source_id=stream.source_id() or None)
+                watcher.start()
+                watchers.append(watcher)
+            sleep(SESSION_SCAN_PERIOD)
+    except KeyboardInterrupt:
+        pass
+    for watcher in watchers:
+        watcher.stop()
+    server.stop()
+    print(server)
+
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--record", help="folder where the pulled chunks are recorded")
+    parser.add_argument("--replay", help="folder of a recorded session to use instead of LSL")
+    parser.add_argument("--source-id", help="only use the stream of this source (headset), e.g. after a reconnect")
+    parser.add_argument("--fast", action="store_true", help="replay as fast as possible")
+    parser.add_argument("--filter", action="store_true", help="detrend and smooth the gyro before detecting")
+    parser.add_argument("--threshold-mode", choices=[FIXED, ADAPTIVE], default=FIXED, help="threshold the run starts with")
+    parser.add_argument(
+        "--noise-factor", type=float, default=DEFAULT_NOISE_FACTOR, help="adaptive threshold in calibration std units"
+    )
+    parser.add_argument("--predictive", action="store_true", help="fire at the gesture onset, cancel if it reverses")
+    parser.add_argument("--viewer", action="store_true", help="plot the gyro stream while detecting")
+    parser.add_argument("--share", metavar="NAME", help="publish the window in shared memory for viewer.py NAME")
+    parser.add_argument("--host", default=MQTT_HOST, help="MQTT broker, e.g. a local mosquitto")
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    parser.add_argument(
+        "--qos", type=int, choices=[0, 1, 2],
+        help=f"actions QoS (default {DEFAULT_QOS} for toggles, {BINARY_QOS} with --binary)",
+    )
+    parser.add_argument("--client-id", help="stable MQTT client id, the broker keeps its session between runs")
+    parser.add_argument("--binary", action="store_true", help="send compact binary set-state actions")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port")
+    parser.add_argument("--metrics-json", help="dump the metrics to this JSON file every few seconds")
+    parser.add_argument("--sessions", action="store_true", help="one session per headset found, each with its own topics")
+    parser.add_argument("--asyncio", action="store_true", help="single threaded asyncio runtime (no viewer)")
+    args = parser.parse_args()
+    if args.qos is None:
+        args.qos = BINARY_QOS if args.binary else DEFAULT_QOS
+    if args.noise_factor <= 0:
+        parser.error("--noise-factor must be positive")
+    if args.record and os.path.isdir(args.record) and os.listdir(args.record):
+        # * Before connecting anything, a session folder holds a single run
+        parser.error(f"{args.record} is not empty, record into a new folder")
+
+    if args.metrics_port or args.metrics_json:
+        registry.enable()
+        if args.metrics_port:
+            registry.serve(args.metrics_port)
+        if args.metrics_json:
+            registry.dump_every(args.metrics_json, METRICS_DUMP_PERIOD)
+
+    if args.sessions:
+        run_sessions(args)
+        return
+
     # * Setup MQTT connection
     mqtt_conection = MQTTConection(
-        SETTINGS_TOPIC, "test.mosquitto.org", 1883, 60
+        SETTINGS_TOPIC, args.host, args.port, 60, start_settings(args), qos=args.qos, binary=args.binary, client_id=args.client_id
     )
-    mqtt_conection.start()
-    # * Then search for the data that is being streamed
-    streams = resolve_streams()
-
-    if (len(streams) == 0):
-        raise (RuntimeError("No streams found"))
+    if not args.asyncio:
+        mqtt_conection.start()
 
+    filter = args.filter
+    scale = 1
+    window = 10
     gyro_stream: MuseStream = None
-    for stream in streams:
-        if stream.type() == "GYRO":
-            filter = False
-            scale = 1
-            window = 10
-            gyro_stream = MuseStream(stream, filter, scale, window)
-            print(gyro_stream)
-            print("")
-
-    # * Creating tbe canvas with all the plots we found in the stream
-    figure = "15x6"
-    figsize = np.int16(figure.split('x'))
-    fig, axes = plt.subplots(1, figsize=figsize)
-    gyro = Gyro(gyro_stream, mqtt_conection, axes)
-    gyro.calibrate()
-    gyro.detect()
-    # lsl_viewer = LSLViewer(gyro_stream, fig, axes, gyro.mean)
-    # lsl_viewer.start()
+    watcher: StreamWatcher = None
+    if args.replay:
+        replay = ReplayInlet(args.replay, "GYRO", realtime=not args.fast)
+        gyro_stream = MuseStream(replay.info(), filter, scale, window, inlet=replay)
+        print(gyro_stream)
+        print("")
+    else:
+        # * Then search for the data that is being streamed
+        discovery = Discovery()
+        stream = discovery.resolve("GYRO", args.source_id)
+
+        if stream is None:
+            raise (RuntimeError("No GYRO stream found"))
+
+        gyro_stream = MuseStream(stream, filter, scale, window)
+        print(gyro_stream)
+        print("")
+        # * A headset that reconnects is picked up again without restarting
+        # * Only this headset, another performer's must not inherit the calibration
+        watcher = StreamWatcher(gyro_stream, discovery, source_id=args.source_id or stream.source_id() or None)
+        watcher.start()
+
+    if args.record:
+        gyro_stream.record(args.record)
+    if args.share:
+        gyro_stream.share(args.share)
+        print(f"Shared as {args.share}, plot it with: python viewer.py {args.share}")
+
+    try:
+        if args.asyncio:
+            gyro = Gyro(gyro_stream, mqtt_conection, predictive=args.predictive)
+            asyncio.run(async_runtime.run(gyro, mqtt_conection))
+            print(gyro_stream.gaps)
+            print(mqtt_conection.publisher)
+            return
+        run_threads(args, gyro_stream, mqtt_conection)
+    finally:
+        # * Ctrl+C included: the recording is flushed with both files the same length
+        if watcher is not None:
+            watcher.stop()
+        gyro_stream.close()
+
+def run_threads(args, gyro_stream: MuseStream, mqtt_conection: MQTTConection):
+    # * Acquisition runs on its own thread, detection and the viewer consume from it.
+    # * A fast replay waits for detection instead of dropping chunks
+    acquisition = Acquisition(gyro_stream)
+    offline = bool(args.replay and args.fast)
+    gyro = Gyro(gyro_stream, mqtt_conection, queue=acquisition.subscribe(block=offline), predictive=args.predictive)
+    acquisition.start()
+    try:
+        gyro.calibrate()
+        if args.viewer:
+            # * Plotting is only loaded when it is asked for, headless runs never
+            # * import matplotlib
+            import matplotlib.pyplot as plt
+            from modules.lsl_viewer import LSLViewer
+
+            # * Creating tbe canvas with all the plots we found in the stream
+            figure = "15x6"
+            figsize = np.int16(figure.split('x'))
+            fig, axes = plt.subplots(1, figsize=figsize)
+
+            detection = Thread(target=gyro.detect)
+            detection.daemon = True
+            detection.start()
+            lsl_viewer = LSLViewer(gyro_stream, fig, axes, gyro.mean, acquisition=acquisition)
+            lsl_viewer.start()
+        else:
+            gyro.detect()
+    finally:
+        acquisition.stop()
+    print(acquisition)
+    print(gyro_stream.gaps)
+    print(mqtt_conection.publisher)
 
 if __name__ == "__main__":
     main()
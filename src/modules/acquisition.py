@@ -0,0 +1,96 @@
+from threading import Thread, Condition
+from collections import deque
+from modules.muse_stream import MuseStream
+from modules.constants import QUEUE_CHUNKS
+
+
+class ChunkQueue:
+    def __init__(self, maxlen: int = QUEUE_CHUNKS, on_put=None, block: bool = False):
+        # * Bounded, when a consumer falls behind the oldest chunk is dropped.
+        # * With `block` the producer waits for room instead, for finite sources
+        # * replayed as fast as possible where nothing is lost by waiting
+        self.chunks = deque(maxlen=maxlen)
+        self.block = block
+        self.closed = False
+        # * Called after every put, for consumers that are scheduled instead of waiting
+        self.on_put = on_put
+        self.ready = Condition()
+        self.received = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def put(self, samples, timestamps):
+        with self.ready:
+            while self.block and not self.closed and len(self.chunks) == self.chunks.maxlen:
+                self.ready.wait(0.1)
+            if len(self.chunks) == self.chunks.maxlen:
+                self.dropped += 1
+            self.chunks.append((samples, timestamps))
+            self.received += 1
+            self.ready.notify_all()
+        if self.on_put is not None:
+            self.on_put()
+
+    def get(self, timeout: float = 0.1):
+        with self.ready:
+            if not self.chunks:
+                self.ready.wait(timeout)
+            if not self.chunks:
+                return [], []
+            chunk = self.chunks.popleft()
+            # * Room for a blocked producer
+            self.ready.notify_all()
+            return chunk
+
+    def close(self):
+        # * The consumer is gone, a blocked producer stops waiting for it
+        with self.ready:
+            self.closed = True
+            self.ready.notify_all()
+
+
+class Acquisition:
+    def __init__(self, muse_stream: MuseStream):
+        self.muse_stream = muse_stream
+        self.queues: list[ChunkQueue] = []
+        self.started = False
+        self.chunks = 0
+        self.samples = 0
+
+    def subscribe(self, maxlen: int = QUEUE_CHUNKS, on_put=None, block: bool = False):
+        # * Every consumer gets its own queue and drains it at its own pace
+        queue = ChunkQueue(maxlen, on_put, block)
+        self.queues.append(queue)
+        return queue
+
+    @property
+    def finished(self):
+        return self.muse_stream.finished
+
+    def run(self):
+        while self.started and not self.muse_stream.finished:
+            samples, timestamps = self.muse_stream.pull(timeout=0.1)
+            if len(timestamps):
+                self.chunks += 1
+                self.samples += len(timestamps)
+                for queue in self.queues:
+                    queue.put(samples, timestamps)
+
+    def start(self):
+        self.started = True
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.started = False
+        for queue in self.queues:
+            queue.close()
+        if getattr(self, "thread", None) is not None:
+            self.thread.join()
+
+    def __str__(self):
+        dropped = [queue.dropped for queue in self.queues]
+        return f"Acquisition [{self.muse_stream.type}]: {self.chunks} chunks, {self.samples} samples, dropped {dropped}"
@@ -0,0 +1,106 @@
+from modules.constants import LSL_EEG_CHUNK, RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY
+import paho.mqtt.client as mqtt
+import threading
+import asyncio
+
+
+class AsyncMQTT:
+    def __init__(self, client: mqtt.Client, loop: asyncio.AbstractEventLoop):
+        # * Drive the paho socket from the event loop instead of loop_start()'s thread
+        self.client = client
+        self.loop = loop
+        self.thread = threading.get_ident()
+        self.reconnects = 0
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+        # * connect() already opened the socket and queued the CONNECT packet
+        sock = self.client.socket()
+        if sock is not None:
+            self.on_socket_open(self.client, None, sock)
+            if self.client.want_write():
+                self.on_socket_register_write(self.client, None, sock)
+
+    def in_loop(self, callback, *args):
+        # * reconnect() runs in an executor thread, the event loop is only
+        # * changed from its own thread
+        if threading.get_ident() == self.thread:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def on_socket_open(self, client, userdata, sock):
+        self.in_loop(self.loop.add_reader, sock, client.loop_read)
+
+    def on_socket_close(self, client, userdata, sock):
+        # * By descriptor, paho closes the socket right after this callback
+        self.in_loop(self.loop.remove_reader, sock.fileno())
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.in_loop(self.loop.add_writer, sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.in_loop(self.loop.remove_writer, sock.fileno())
+
+    async def misc(self):
+        # * Keepalive pings and retries. Without loop_start() nothing reconnects
+        # * by itself: once the connection is lost it is retried here with a
+        # * growing delay, off the loop so detection keeps running meanwhile.
+        # * The new socket is registered again through on_socket_open
+        delay = RECONNECT_MIN_DELAY
+        while True:
+            if self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                await asyncio.sleep(1)
+                continue
+            await asyncio.sleep(delay)
+            try:
+                await self.loop.run_in_executor(None, self.client.reconnect)
+            except OSError as e:
+                print(f"Reconnect failed: {e}")
+                delay = min(2 * delay, RECONNECT_MAX_DELAY)
+                continue
+            self.reconnects += 1
+            delay = RECONNECT_MIN_DELAY
+
+
+async def intake(gyro, actions: asyncio.Queue):
+    # * pull_chunk never blocks here, when the inlet is empty the task sleeps
+    # * half a chunk so the other tasks can run
+    idle = LSL_EEG_CHUNK / gyro.gyro_stream.sfreq / 2
+    gyro.started = True
+    while gyro.started and not gyro.exhausted:
+        samples, timestamps = gyro.gyro_stream.pull(timeout=0.0)
+        if len(timestamps):
+            for detection in gyro.process(samples, timestamps):
+                actions.put_nowait(detection.action)
+            await asyncio.sleep(0)
+        else:
+            await asyncio.sleep(idle)
+    print("End")
+
+
+async def publisher(mqtt_conn, actions: asyncio.Queue):
+    while True:
+        action = await actions.get()
+        mqtt_conn.publish_action(action)
+        actions.task_done()
+
+
+async def run(gyro, mqtt_conn):
+    loop = asyncio.get_running_loop()
+    adapter = AsyncMQTT(mqtt_conn.client, loop)
+    actions = asyncio.Queue()
+
+    # * Calibration runs on the incoming chunks, detection starts when it ends
+    print("Calibrating...")
+    gyro.calibrator.start()
+    tasks = [
+        asyncio.create_task(adapter.misc()),
+        asyncio.create_task(publisher(mqtt_conn, actions)),
+    ]
+    await intake(gyro, actions)
+    await actions.join()
+    for task in tasks:
+        task.cancel()
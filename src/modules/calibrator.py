@@ -0,0 +1,61 @@
+from modules.constants import CALIBRATION_TIME, CALIBRATION_SETTLE
+import numpy as np
+
+
+class Calibrator:
+    def __init__(self, n_chan: int, duration: float = CALIBRATION_TIME, settle: float = CALIBRATION_SETTLE):
+        self.n_chan = n_chan
+        self.duration = duration
+        self.settle = settle
+        self.running = False
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = np.zeros(self.n_chan)
+        self.m2 = np.zeros(self.n_chan)
+        self.started_at = None
+
+    def start(self):
+        self.reset()
+        self.running = True
+
+    @property
+    def var(self):
+        if self.count < 2:
+            return np.zeros(self.n_chan)
+        return self.m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def update(self, samples, timestamps):
+        # * Feed a chunk, returns True once the calibration time has been covered
+        if not self.running or len(timestamps) == 0:
+            return False
+        samples = np.asarray(samples, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+
+        # * The calibration time is measured on the LSL clock, the first
+        # * `settle` seconds are skipped so the performer can stay still
+        if self.started_at is None:
+            self.started_at = timestamps[0] + self.settle
+        elapsed = timestamps - self.started_at
+        used = samples[(elapsed >= 0) & (elapsed < self.duration)]
+
+        if len(used):
+            # * Merge the chunk statistics into the running ones (Welford/Chan)
+            n_b = len(used)
+            mean_b = used.mean(axis=0)
+            m2_b = ((used - mean_b) ** 2).sum(axis=0)
+            n = self.count + n_b
+            delta = mean_b - self.mean
+            self.mean = self.mean + delta * n_b / n
+            self.m2 = self.m2 + m2_b + delta**2 * self.count * n_b / n
+            self.count = n
+
+        if elapsed[-1] >= self.duration and self.count > 0:
+            self.running = False
+            return True
+        return False
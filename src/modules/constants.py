@@ -1,15 +1,85 @@
 # ---------- CONFIG ----------
-SUBSAMPLE = 2
 LSL_EEG_CHUNK = 12
+TIME_CORRECTION_PERIOD = 5  # s between LSL time correction updates
+QUEUE_CHUNKS = 64  # chunks kept for a slow consumer before dropping
+VIEWER_FPS = 20
+SHARED_WINDOW = 60  # s of samples kept in the shared ring for viewer processes
+SNAPSHOT_TIMEOUT = 1  # s a viewer waits for a consistent copy of the shared ring
+LABELS_PERIOD = 1  # s between tick label updates
+METRICS_DUMP_PERIOD = 5  # s between JSON metric dumps
+DISCOVERY_TIMEOUT = 2  # s to wait for a stream when resolving
+DISCOVERY_CACHE = "~/.adaptative-pedal-streams.json"  # last known stream identities
+STALL_TIMEOUT = 2  # s without samples before the stream is searched again
+WATCH_PERIOD = 0.5  # s between checks of the stream watcher
+GAP_TOLERANCE = 3  # missing samples before a hole in the timestamps counts as a gap
+LONG_GAP = 0.5  # s, shorter gaps are interpolated, longer ones are NaN and reset the state
+FILTER_ALIGN_LAG = 0.25  # s a stream waits for the others of its filter group before it is filtered alone
 # ----------------------------
 
 # ---------- MQTT ----------
 SETTINGS_TOPIC = "adaptative-pedal/settings"
 ACTIONS_TOPIC = "adaptative-pedal/actions"
+MQTT_HOST = "test.mosquitto.org"
+MQTT_PORT = 1883
+# * A plain TOGGLE_* delivered twice leaves the pedal in the wrong state. QoS 1
+# * resends it (dup) when the PUBACK is lost and the broker forwards both, QoS 2
+# * delivers it once at the cost of a second round trip (PUBREC/PUBREL/PUBCOMP).
+# * Across a reconnect only a persistent session (--client-id) keeps the QoS 2
+# * state on the broker. The pedal subscribes with QoS 0, the broker never
+# * resends to it. Binary set-state actions are idempotent, one round trip is enough
+DEFAULT_QOS = 2
+BINARY_QOS = 1
+MAX_PENDING_ACTIONS = 32
+RECONNECT_MIN_DELAY = 1  # s before the first reconnect attempt, doubled up to the max
+RECONNECT_MAX_DELAY = 4  # s
+# * Multi-session mode: every headset gets <prefix>/<source_id>/settings and /actions
+SESSION_TOPIC_PREFIX = "adaptative-pedal"
+SESSION_WORKERS = 4  # detection threads shared by all the sessions
+SESSION_SCAN_PERIOD = 5  # s between searches for new headsets
+# * Threshold modes
+FIXED = "FIXED"
+ADAPTIVE = "ADAPTIVE"
+# * Settings actions accepted over MQTT and how their "value" is read
+# * (None = no value, a tuple = one of these strings)
+SETTINGS_SCHEMA = {
+    "CHANGE_THRESHOLD": int,
+    "DEFAULT_THRESHOLD": None,
+    "CALIBRATE": None,
+    "THRESHOLD_MODE": (FIXED, ADAPTIVE),
+    "CHANGE_NOISE_FACTOR": float,
+}
+# ----------------------------
+
+# ---------- BINARY PROTOCOL ----------
+# * version (B) | action code (B) | sender boot id (H) | sequence (H) | sender time in ms mod 2^32 (I)
+BINARY_VERSION = 0xA2
+BINARY_FORMAT = "<BBHHI"
+SET_CELESTINO_ON = 1
+SET_CELESTINO_OFF = 2
+SET_SOSTENUTO_ON = 3
+SET_SOSTENUTO_OFF = 4
+STATE_ECHO_TIMEOUT = 2  # s for the firmware to report a command back before its own report wins
 # ----------------------------
 
 # ---------- PIANO ----------
 TOGGLE_CELESTINO = "TOGGLE_CELESTINO"
 TOGGLE_SOSTENUTO = "TOGGLE_SOSTENUTO"
 DEFAULT_THRESHOLD = 40
+GYRO_AXIS = 1  # Y
+GYRO_SFREQ = 52  # Hz, nominal rate of the Muse gyroscope
+DEFAULT_NOISE_FACTOR = 6  # adaptive threshold, in calibration std units
+MIN_THRESHOLD = 5  # adaptive threshold floor for a very still calibration
+BASELINE_TIME_CONSTANT = 30  # s, drift followed by the adaptive baseline
+CALIBRATION_TIME = 5  # s
+CALIBRATION_SETTLE = 1  # s skipped before calibrating
+REFRACTORY_PERIOD = 0.3  # s, same pedal can't fire again before this
+REBOUND_PERIOD = 1  # s, opposite pedal ignores the head coming back
+GAP_SETTLE = 0.5  # s both pedals stay blocked after a long gap
+# * Predictive mode: fire when the rate extrapolated PREDICT_HORIZON ahead
+# * crosses the threshold and the movement is already under way
+PREDICT_HORIZON = 0.08  # s
+PREDICT_ONSET = 5  # calibration std units the rate must already be above
+PREDICT_MIN_CONFIDENCE = 0.5  # fraction of the threshold reached, lower toggles aren't sent
+PREDICT_CONFIRM = 0.2  # s to reach the threshold before the toggle is cancelled
+SLOPE_SPAN = 5  # samples the slope is fitted over (least squares)
 # ----------------------------
@@ -0,0 +1,68 @@
+from modules.ring_buffer import RingBuffer
+import numpy as np
+
+
+class MinMaxDecimator:
+    def __init__(self, n_chan: int, n_samples: int, width: int):
+        # * The window is cut in buckets of `bucket` samples, about one per pixel,
+        # * and every bucket is drawn as its min and max in the order they
+        # * happened. A spike always survives, unlike with a fixed stride
+        self.n_chan = n_chan
+        self.n_samples = n_samples
+        self.width = width
+        self.bucket = max(1, int(np.ceil(n_samples / max(width, 1))))
+        n_buckets = int(np.ceil(n_samples / self.bucket)) + 1
+        # * Two points per bucket, each channel has its own times (its extremes)
+        self.times = RingBuffer(2 * n_buckets, n_chan, fill=np.nan)
+        self.values = RingBuffer(2 * n_buckets, n_chan, fill=np.nan)
+        # * Samples of the bucket that isn't complete yet
+        self.pending_times = np.empty(0)
+        self.pending_values = np.empty((0, n_chan))
+        self.last_time = None
+
+    def fits(self, n_samples: int, width: int):
+        return n_samples == self.n_samples and width == self.width
+
+    def extend(self, times, values):
+        # * Only the new samples are bucketed, the cost per frame doesn't depend
+        # * on the window length
+        if not len(times):
+            return
+        self.last_time = times[-1]
+        times = np.concatenate([self.pending_times, times])
+        values = np.concatenate([self.pending_values, values])
+        full = len(times) // self.bucket * self.bucket
+        self.pending_times, self.pending_values = times[full:], values[full:]
+        if full == 0:
+            return
+
+        buckets = values[:full].reshape(-1, self.bucket, self.n_chan)
+        bucket_times = times[:full].reshape(-1, self.bucket, 1)
+        low, high = buckets.argmin(axis=1), buckets.argmax(axis=1)
+        order = np.stack([np.minimum(low, high), np.maximum(low, high)], axis=1)
+        self.values.append(np.take_along_axis(buckets, order, axis=1).reshape(-1, self.n_chan))
+        self.times.append(
+            np.take_along_axis(np.broadcast_to(bucket_times, buckets.shape), order, axis=1).reshape(-1, self.n_chan)
+        )
+
+    def points(self):
+        # * (times, values) per channel, complete buckets plus the raw tail
+        times = np.concatenate([self.times.latest(), np.repeat(self.pending_times[:, None], self.n_chan, axis=1)])
+        values = np.concatenate([self.values.latest(), self.pending_values])
+        return times, values
+
+
+def follow(decimator: MinMaxDecimator, muse_stream, width: int):
+    # * Feed the decimator the samples that arrived since the last frame, only
+    # * those are copied out of the stream. A new one is made from a full
+    # * snapshot when the window or the axes width change, or when the viewer
+    # * fell more than a window behind
+    if decimator is not None and decimator.last_time is not None:
+        update = muse_stream.snapshot_since(decimator.last_time)
+        if update is not None and decimator.fits(update[2], width):
+            decimator.extend(update[0], update[1])
+            return decimator
+    times, source = muse_stream.snapshot()
+    decimator = MinMaxDecimator(muse_stream.n_chan, len(times), width)
+    decimator.extend(times, source)
+    return decimator
@@ -0,0 +1,111 @@
+from pylsl import StreamInfo, resolve_bypred, resolve_streams
+from modules.constants import DISCOVERY_TIMEOUT, DISCOVERY_CACHE, STALL_TIMEOUT, WATCH_PERIOD
+from modules.muse_stream import MuseStream
+from threading import Thread, Event
+from time import perf_counter
+import json
+import os
+
+
+def predicate(stream_type: str, source_id: str = None):
+    # * XPath query evaluated by liblsl, only matching streams answer
+    query = f"type='{stream_type}'"
+    if source_id:
+        query += f" and source_id='{source_id}'"
+    return query
+
+
+class Discovery:
+    def __init__(self, cache_path: str = DISCOVERY_CACHE, timeout: float = DISCOVERY_TIMEOUT):
+        self.cache_path = os.path.expanduser(cache_path)
+        self.timeout = timeout
+        # * stream type -> {"name", "source_id", "uid"} of the last stream used
+        self.known = {}
+        try:
+            with open(self.cache_path) as f:
+                self.known = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def resolve(self, stream_type: str, source_id: str = None, timeout: float = None):
+        # * The cached source is asked first, any stream of the type after that.
+        # * Returns None when nothing answered within the timeout
+        timeout = self.timeout if timeout is None else timeout
+        cached = self.known.get(stream_type, {})
+        sources = [source_id] if source_id else [cached.get("source_id"), None]
+        for source in dict.fromkeys(sources):
+            if source is None and source_id:
+                continue
+            streams = resolve_bypred(predicate(stream_type, source), 1, timeout)
+            if streams:
+                # * Same outlet as last time if it is still there
+                stream = next((s for s in streams if s.uid() == cached.get("uid")), streams[0])
+                self.remember(stream)
+                return stream
+        return None
+
+    def resolve_all(self, stream_type: str, timeout: float = None):
+        # * Every stream of the type that answered within the timeout, one per
+        # * headset. resolve_bypred would return as soon as the first one answers
+        timeout = self.timeout if timeout is None else timeout
+        streams = [stream for stream in resolve_streams(timeout) if stream.type() == stream_type]
+        return list({stream.source_id() or stream.uid(): stream for stream in streams}.values())
+
+    def remember(self, stream: StreamInfo):
+        self.known[stream.type()] = {"name": stream.name(), "source_id": stream.source_id(), "uid": stream.uid()}
+        try:
+            with open(self.cache_path, "w") as f:
+                json.dump(self.known, f, indent=2)
+        except OSError:
+            pass
+
+
+class StreamWatcher:
+    def __init__(self, muse_stream: MuseStream, discovery: Discovery, source_id: str = None, stall_timeout: float = STALL_TIMEOUT, period: float = WATCH_PERIOD):
+        self.muse_stream = muse_stream
+        self.discovery = discovery
+        # * Only this headset may replace the stream, any of the type otherwise
+        self.source_id = source_id
+        self.stall_timeout = stall_timeout
+        self.period = period
+        self.stopped = Event()
+        self.reattached = 0
+
+    def run(self):
+        # * No new samples for a while means the outlet is gone (headset off or
+        # * muselsl restarted). The stream is searched again and, if it comes
+        # * back as a new outlet, the inlet is swapped under the MuseStream
+        received = self.muse_stream.received
+        changed_at = perf_counter()
+        lost = False
+        while not self.stopped.wait(self.period):
+            if self.muse_stream.received != received:
+                received = self.muse_stream.received
+                changed_at = perf_counter()
+                lost = False
+                continue
+            if perf_counter() - changed_at < self.stall_timeout:
+                continue
+            if not lost:
+                print(f"⚠️  {self.muse_stream.type} stream lost, searching...")
+                lost = True
+            stream = self.discovery.resolve(self.muse_stream.type, self.source_id, timeout=self.period)
+            if stream is None or stream.uid() == self.muse_stream.stream.uid():
+                # * Nothing yet, or the same outlet that liblsl will recover by itself
+                continue
+            try:
+                self.muse_stream.reattach(stream)
+            except RuntimeError as e:
+                print(f"❌ {e}")
+                continue
+            self.reattached += 1
+            changed_at = perf_counter()
+            print(f"✅ {self.muse_stream.type} stream reattached ({stream.source_id()})")
+
+    def start(self):
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
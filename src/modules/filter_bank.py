@@ -0,0 +1,166 @@
+from modules.constants import FILTER_ALIGN_LAG
+from scipy.signal import butter, sosfilt, sosfilt_zi
+from functools import lru_cache
+import numpy as np
+
+
+@lru_cache(maxsize=None)
+def design_sos(sfreq: float, btype: str, cutoff, order: int):
+    return butter(order, np.asarray(cutoff) / (sfreq / 2.0), btype=btype, output="sos")
+
+
+class FilterGroup:
+    # * Streams that share the sample rate and the filter design. Their channels
+    # * are stacked side by side and filtered with a single sosfilt call, the
+    # * state of all of them lives in one (sections, 2, channels) array
+    def __init__(self, sos, members: list[str], n_chans: list[int]):
+        self.sos = sos
+        self.members = members
+        self.slices = {}
+        start = 0
+        for stream_type, n_chan in zip(members, n_chans):
+            self.slices[stream_type] = slice(start, start + n_chan)
+            start += n_chan
+        self.zi = np.zeros((len(sos), 2, start))
+        self.seeded = False
+
+
+class FilterBank:
+    def __init__(self, align_lag: float = FILTER_ALIGN_LAG):
+        # * stream type -> {"sfreq", "n_chan", "design", "last", "pending"}
+        self.streams = {}
+        self.groups = []
+        self.align_lag = align_lag
+        self.calls = 0
+        # * Filtered before process() was called, returned by its next call
+        self.ready = {}
+
+    def register(self, stream_type: str, sfreq: float, n_chan: int, btype: str, cutoff, order: int = 4):
+        self.streams[stream_type] = {
+            "sfreq": sfreq,
+            "n_chan": n_chan,
+            "design": (btype, cutoff if np.isscalar(cutoff) else tuple(cutoff), order),
+            "last": None,
+            # * Samples kept until the other streams of the group catch up
+            "pending": np.empty((0, n_chan)),
+        }
+        self.rebuild()
+
+    def configure(self, stream_type: str, btype: str = None, cutoff=None, order: int = None):
+        # * Change the band or the order while running
+        old = self.streams[stream_type]["design"]
+        self.streams[stream_type]["design"] = (
+            btype or old[0],
+            old[1] if cutoff is None else (cutoff if np.isscalar(cutoff) else tuple(cutoff)),
+            order or old[2],
+        )
+        self.rebuild()
+
+    def rebuild(self):
+        previous = {stream_type: (group, group.slices[stream_type]) for group in self.groups for stream_type in group.members}
+        by_design = {}
+        for stream_type, stream in self.streams.items():
+            key = (stream["sfreq"],) + stream["design"]
+            by_design.setdefault(key, []).append(stream_type)
+
+        self.groups = []
+        for (sfreq, btype, cutoff, order), members in by_design.items():
+            sos = design_sos(sfreq, btype, cutoff, order)
+            group = FilterGroup(sos, members, [self.streams[m]["n_chan"] for m in members])
+            for stream_type in members:
+                old = previous.get(stream_type)
+                target = group.slices[stream_type]
+                if old is not None and old[0].sos.shape == sos.shape and np.array_equal(old[0].sos, sos):
+                    # * Same design, keep the running state
+                    group.zi[:, :, target] = old[0].zi[:, :, old[1]]
+                elif self.streams[stream_type]["last"] is not None:
+                    # * New design, start from the steady state of the last input
+                    # * so the output doesn't jump
+                    group.zi[:, :, target] = sosfilt_zi(sos)[:, :, None] * self.streams[stream_type]["last"]
+            group.seeded = all(self.streams[m]["last"] is not None for m in members)
+            self.groups.append(group)
+
+    def reset(self, stream_type: str):
+        # * Forget the state of one stream, it is seeded again from its next chunk.
+        # * Samples still waiting are from before the reset, they keep the old state
+        for group in self.groups:
+            if stream_type in group.slices:
+                if len(self.streams[stream_type]["pending"]):
+                    self.filter(group, [stream_type], len(self.streams[stream_type]["pending"]), self.ready)
+                group.seeded = False
+        self.streams[stream_type]["last"] = None
+
+    def seed(self, group: FilterGroup):
+        for stream_type in group.members:
+            pending = self.streams[stream_type]["pending"]
+            if self.streams[stream_type]["last"] is None and len(pending):
+                first = pending[0]
+                group.zi[:, :, group.slices[stream_type]] = sosfilt_zi(group.sos)[:, :, None] * first
+                self.streams[stream_type]["last"] = first
+        group.seeded = all(self.streams[m]["last"] is not None for m in group.members)
+
+    def filter(self, group: FilterGroup, members: list[str], n: int, out: dict):
+        # * Filter the first n pending samples of `members` in one call
+        if not group.seeded:
+            self.seed(group)
+        self.calls += 1
+        if len(members) == len(group.members):
+            stacked = np.hstack([self.streams[m]["pending"][:n] for m in members])
+            filtered, group.zi = sosfilt(group.sos, stacked, axis=0, zi=group.zi)
+            parts = {m: filtered[:, group.slices[m]] for m in members}
+        else:
+            (m,) = members
+            target = group.slices[m]
+            parts = {}
+            parts[m], group.zi[:, :, target] = sosfilt(
+                group.sos, self.streams[m]["pending"][:n], axis=0, zi=group.zi[:, :, target]
+            )
+        for m, part in parts.items():
+            stream = self.streams[m]
+            stream["last"] = stream["pending"][n - 1]
+            stream["pending"] = stream["pending"][n:]
+            out[m] = part if m not in out else np.vstack([out[m], part])
+
+    def process(self, chunks: dict):
+        # * chunks: stream type -> (samples, channels). Returns the filtered
+        # * samples ready so far, oldest first. The streams of a group rarely
+        # * bring the same number of samples in a pass: the common part is
+        # * filtered with one call and the rest waits for the next pass
+        for stream_type, samples in chunks.items():
+            if len(samples) and stream_type in self.streams:
+                stream = self.streams[stream_type]
+                stream["pending"] = np.vstack([stream["pending"], np.asarray(samples, dtype=np.float64)])
+        out, self.ready = self.ready, {}
+        for group in self.groups:
+            lengths = [len(self.streams[m]["pending"]) for m in group.members]
+            if not any(lengths):
+                continue
+            if min(lengths):
+                self.filter(group, group.members, min(lengths), out)
+            for m in group.members:
+                # * The others stalled (dropout, end of a replay): don't wait forever
+                stream = self.streams[m]
+                if len(stream["pending"]) > self.align_lag * stream["sfreq"]:
+                    self.filter(group, [m], len(stream["pending"]), out)
+        return out
+
+    def flush(self):
+        # * Filter whatever is still pending, each stream on its own
+        out, self.ready = self.ready, {}
+        for group in self.groups:
+            for m in group.members:
+                if len(self.streams[m]["pending"]):
+                    self.filter(group, [m], len(self.streams[m]["pending"]), out)
+        return out
+
+
+def default_filter_bank(muse_streams, eeg_band=(1, 40), eeg_order: int = 4):
+    # * EEG: 1-40 Hz band. Motion: drift removal, same designs as default_pipeline
+    # * but as 4th/2nd order sections
+    bank = FilterBank()
+    for muse_stream in muse_streams:
+        if muse_stream.type == "EEG":
+            bank.register(muse_stream.type, muse_stream.sfreq, muse_stream.n_chan, "bandpass", eeg_band, order=eeg_order)
+        else:
+            bank.register(muse_stream.type, muse_stream.sfreq, muse_stream.n_chan, "highpass", 0.1, order=2)
+    return bank
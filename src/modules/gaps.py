@@ -0,0 +1,49 @@
+from modules.constants import GAP_TOLERANCE, LONG_GAP
+from modules.metrics import registry, NULL_METRIC
+
+
+class GapTracker:
+    def __init__(self, sfreq: float, labels: dict = None, tolerance: int = GAP_TOLERANCE, long_gap: float = LONG_GAP):
+        # * Holes are found from the LSL timestamps: the first sample of a chunk
+        # * should come one period after the last sample of the previous one
+        self.period = 1.0 / sfreq
+        self.tolerance = tolerance
+        self.long_gap = long_gap
+        self.last = None
+        self.count = 0
+        self.long_count = 0
+        self.missing = 0
+        self.longest = 0.0
+
+        # * Only the tracker of a stream reports, consumers keep their own copy
+        self.gaps_metric = self.missing_metric = NULL_METRIC
+        if labels is not None:
+            self.gaps_metric = registry.counter("pedal_gaps_total", "Holes found in the stream timestamps", labels)
+            self.missing_metric = registry.counter("pedal_missing_samples_total", "Samples lost in gaps", labels)
+
+    def check(self, timestamps):
+        # * Returns the number of samples missing before this chunk, 0 if it
+        # * follows the previous one (jitter below the tolerance is ignored)
+        if not len(timestamps):
+            return 0
+        previous, self.last = self.last, timestamps[-1]
+        if previous is None:
+            return 0
+        elapsed = timestamps[0] - previous
+        missing = int(round(elapsed / self.period)) - 1
+        if missing < self.tolerance:
+            return 0
+        self.count += 1
+        self.missing += missing
+        self.longest = max(self.longest, elapsed)
+        if self.is_long(missing):
+            self.long_count += 1
+        self.gaps_metric.inc()
+        self.missing_metric.inc(missing)
+        return missing
+
+    def is_long(self, missing: int):
+        return (missing + 1) * self.period >= self.long_gap
+
+    def __str__(self):
+        return f"Gaps: {self.count} ({self.long_count} long), {self.missing} samples missing, longest {self.longest:.3f} s"
@@ -0,0 +1,104 @@
+from modules.constants import TOGGLE_CELESTINO, TOGGLE_SOSTENUTO, REFRACTORY_PERIOD, REBOUND_PERIOD
+import numpy as np
+
+# * Pedal states
+ARMED = "ARMED"
+FIRED = "FIRED"
+REFRACTORY = "REFRACTORY"
+
+
+class Pedal:
+    def __init__(self, action: str, sign: int):
+        self.action = action
+        # * +1 fires above the threshold, -1 fires below -threshold
+        self.sign = sign
+        self.state = ARMED
+        self.fired_at = float("-inf")
+        self.blocked_until = float("-inf")
+
+    def __str__(self):
+        return f"{self.action} [{self.state}]"
+
+
+class Detection:
+    def __init__(self, pedal: Pedal, index: int, timestamp: float, value: float, confidence: float = 1.0, cancel: bool = False):
+        self.pedal = pedal
+        self.action = pedal.action
+        # * How sure the detector was when it fired (1 = the threshold was crossed)
+        self.confidence = confidence
+        # * Undoes an earlier detection of the same pedal that didn't confirm
+        self.cancel = cancel
+        # * Position of the crossing sample inside the chunk
+        self.index = index
+        self.timestamp = timestamp
+        self.value = value
+
+    def __str__(self):
+        kind = "cancel " if self.cancel else ""
+        return f"{kind}{self.action} at sample {self.index} ({self.timestamp:.3f} s, confidence {self.confidence:.2f})"
+
+
+class GestureDetector:
+    def __init__(self, refractory: float = REFRACTORY_PERIOD, rebound: float = REBOUND_PERIOD):
+        self.refractory = refractory
+        self.rebound = rebound
+        self.pedals = [Pedal(TOGGLE_CELESTINO, 1), Pedal(TOGGLE_SOSTENUTO, -1)]
+
+    def advance(self, timestamp: float):
+        for pedal in self.pedals:
+            if pedal.state == FIRED:
+                pedal.state = REFRACTORY
+            if pedal.state == REFRACTORY and timestamp >= pedal.fired_at + self.refractory:
+                pedal.state = ARMED
+
+    def armed_at(self, pedal: Pedal):
+        # * First timestamp the pedal can fire at. An ARMED pedal only waits for
+        # * the rebound guard, FIRED and REFRACTORY ones also for the end of the
+        # * refractory period, which is where advance() arms them again
+        if pedal.state == ARMED:
+            return pedal.blocked_until
+        return max(pedal.blocked_until, pedal.fired_at + self.refractory)
+
+    def update_chunk(self, values, timestamps, threshold: float):
+        # * Test every sample of the chunk at once against each pedal and fire on
+        # * the first allowed crossing. Never blocks, returns a list of Detection
+        values = np.asarray(values, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        detections = []
+        start = 0
+        if len(timestamps):
+            self.advance(timestamps[0])
+        while start < len(values):
+            first, first_pedal = len(values), None
+            for pedal in self.pedals:
+                crossed = (pedal.sign * values[start:first] > threshold) & (
+                    timestamps[start:first] >= self.armed_at(pedal)
+                )
+                if crossed.any():
+                    first, first_pedal = start + int(crossed.argmax()), pedal
+            if first_pedal is None:
+                break
+            self.advance(timestamps[first])
+            self.fire(first_pedal, timestamps[first])
+            detections.append(Detection(first_pedal, first, timestamps[first], values[first]))
+            start = first + 1
+        return detections
+
+    def fire(self, pedal: Pedal, timestamp: float):
+        pedal.state = FIRED
+        pedal.fired_at = timestamp
+        # * The head coming back to rest looks like the opposite gesture
+        for other in self.pedals:
+            if other is not pedal:
+                other.blocked_until = timestamp + self.rebound
+
+    def hold(self, until: float):
+        # * Neither pedal fires before `until`, e.g. while the signal settles
+        for pedal in self.pedals:
+            pedal.blocked_until = max(pedal.blocked_until, until)
+
+    def reset(self):
+        for pedal in self.pedals:
+            pedal.state = ARMED
+            pedal.fired_at = float("-inf")
+            pedal.blocked_until = float("-inf")
@@ -0,0 +1,169 @@
+import matplotlib.pyplot as plt
+from threading import Thread
+from time import perf_counter, sleep
+from modules.stream_group import StreamGroup
+from modules.decimator import follow
+from modules.constants import VIEWER_FPS, LABELS_PERIOD, GYRO_AXIS
+import numpy as np
+import sys
+
+
+def tilt(acc):
+    # * Angle in degrees between every accelerometer sample and the mean
+    # * gravity direction of the window, whatever way the headset sits
+    unit = acc / np.linalg.norm(acc, axis=1, keepdims=True)
+    gravity = np.nanmean(unit, axis=0)
+    gravity /= np.linalg.norm(gravity)
+    return np.degrees(np.arccos(np.clip(unit @ gravity, -1, 1)))
+
+
+class GroupViewer:
+    def __init__(self, group: StreamGroup, fig, axes):
+        # * One panel per stream of the group. With GYRO and ACC an extra
+        # * panel shows the nod rate and the head tilt resampled on the same
+        # * timeline, the alignment a gyro + accelerometer gesture needs
+        self.group = group
+        self.fig = fig
+        self.fig.canvas.mpl_connect("key_press_event", self.OnKeypress)
+        self.fig.canvas.mpl_connect("close_event", self.stop_event)
+        self.streams = list(group.streams.values())
+        self.curr_stream = 0
+        for muse_stream, ax in zip(self.streams, axes):
+            muse_stream.setup_ax(ax)
+        self.decimators = {}
+        self.lines = [line for muse_stream in self.streams for line in muse_stream.lines]
+
+        self.fusion = None
+        if "GYRO" in group and "ACC" in group and len(axes) > len(self.streams):
+            self.fusion = axes[len(self.streams)]
+            (rate,) = self.fusion.plot([], [], lw=1, label="GYRO Y (°/s)")
+            (angle,) = self.fusion.plot([], [], lw=1, label="ACC tilt (°)")
+            self.fusion_lines = [rate, angle]
+            self.lines += self.fusion_lines
+            self.fusion.set_xlabel("Time (s)")
+            self.fusion.set_ylabel("GYRO + ACC")
+            self.fusion.legend(loc="upper left")
+
+        self.frame_period = 1.0 / VIEWER_FPS
+        self.last_frame = 0
+        self.last_labels = 0
+        self.background = None
+        self.blit = self.fig.canvas.supports_blit
+        for line in self.lines:
+            line.set_animated(self.blit)
+        self.fig.canvas.mpl_connect("draw_event", self.on_draw)
+        help_str = """
+            toggle filter : d
+            lower / raise filter order : [ / ]
+            zoom out : /
+            zoom in : *
+            increase time scale : -
+            decrease time scale : +
+            change stream backward: <-
+            change stream forward: ->
+            """
+        print(help_str)
+
+    def OnKeypress(self, event):
+        muse_stream = self.streams[self.curr_stream]
+        if event.key == "/":
+            muse_stream.scale *= 1.2
+        elif event.key == "*":
+            muse_stream.scale /= 1.2
+        elif event.key == "+":
+            muse_stream.window += 1
+        elif event.key == "-":
+            if muse_stream.window > 1:
+                muse_stream.window -= 1
+        elif event.key == "d":
+            if self.group.filter_bank is not None and muse_stream.type in self.group.filter_bank.streams:
+                muse_stream.filt = not muse_stream.filt
+                print(f"{muse_stream.type} filter {'on' if muse_stream.filt else 'off'}")
+            else:
+                print(f"{muse_stream.type} isn't filtered")
+        elif event.key in ("[", "]"):
+            if self.group.filter_bank is not None and muse_stream.type in self.group.filter_bank.streams:
+                order = self.group.filter_bank.streams[muse_stream.type]["design"][2] + (1 if event.key == "]" else -1)
+                if order >= 1:
+                    btype, cutoff, order = self.group.configure(muse_stream.type, order=order)
+                    print(f"{muse_stream.type} filter: {btype} {cutoff} Hz, order {order}")
+        elif event.key == "left":
+            self.curr_stream = (self.curr_stream - 1) % len(self.streams)
+            print("You're at", self.streams[self.curr_stream].type)
+        elif event.key == "right":
+            self.curr_stream = (self.curr_stream + 1) % len(self.streams)
+            print("You're at", self.streams[self.curr_stream].type)
+
+    def on_draw(self, event):
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_lines()
+
+    def draw_lines(self):
+        for line in self.lines:
+            line.axes.draw_artist(line)
+
+    def render_stream(self, muse_stream):
+        # * Same decimation as LSLViewer, only the samples the group thread
+        # * pushed since the last frame are copied. Raw streams are centred on
+        # * their window mean
+        offset = 0 if muse_stream.filt else muse_stream.window_mean()
+        width = int(muse_stream.axes.get_window_extent().width)
+        key = (muse_stream.type, muse_stream.filt)
+        decimator = self.decimators[key] = follow(self.decimators.get(key), muse_stream, width)
+        points, values = decimator.points()
+        x = points - decimator.last_time
+        y = (values - offset) / muse_stream.scale - np.arange(muse_stream.n_chan)
+        for ii in range(muse_stream.n_chan):
+            muse_stream.lines[ii].set_data(x[:, ii], y[:, ii])
+
+    def render_fusion(self):
+        gyro = self.group["GYRO"]
+        grid, data = self.group.aligned(gyro.window, gyro.sfreq, ["GYRO", "ACC"])
+        if len(grid) < 2:
+            return
+        x = grid - grid[-1]
+        rate = data["GYRO"][:, GYRO_AXIS]
+        self.fusion_lines[0].set_data(x, rate - np.nanmean(rate))
+        self.fusion_lines[1].set_data(x, tilt(data["ACC"]))
+
+    def update_plot(self):
+        while self.started:
+            sleep(max(self.frame_period - (perf_counter() - self.last_frame), 0))
+            self.last_frame = perf_counter()
+            for muse_stream in self.streams:
+                self.render_stream(muse_stream)
+            if self.fusion is not None:
+                self.render_fusion()
+
+            now = perf_counter()
+            if not self.blit or self.background is None or now - self.last_labels >= LABELS_PERIOD:
+                for muse_stream in self.streams:
+                    impedances = muse_stream.window_std()
+                    muse_stream.axes.set_yticklabels(
+                        ["%s - %.2f" % (muse_stream.ch_names[ii], impedances[ii]) for ii in range(muse_stream.n_chan)]
+                    )
+                    muse_stream.axes.set_xlim(-muse_stream.window, 0)
+                if self.fusion is not None:
+                    self.fusion.set_xlim(-self.group["GYRO"].window, 0)
+                    self.fusion.relim()
+                    self.fusion.autoscale_view(scalex=False)
+                self.fig.canvas.draw()
+                self.last_labels = now
+            else:
+                self.fig.canvas.restore_region(self.background)
+                self.draw_lines()
+                self.fig.canvas.blit(self.fig.bbox)
+            self.fig.canvas.flush_events()
+        print("End")
+
+    def start(self):
+        self.started = True
+        self.thread = Thread(target=self.update_plot)
+        self.thread.daemon = True
+        self.thread.start()
+        plt.show()
+
+    def stop_event(self, close_event):
+        self.started = False
+        print("Killing all the threads")
+        sys.exit()
@@ -1,13 +1,14 @@
 import matplotlib.pyplot as plt
 from threading import Thread
+from time import perf_counter, sleep
 from modules.muse_stream import MuseStream
+from modules.decimator import follow
 from modules.constants import *
 import numpy as np
 import sys
-from scipy.signal import lfilter, lfilter_zi, firwin
 
 class LSLViewer:
-    def __init__(self, gyro_stream: MuseStream, fig, axes, means):
+    def __init__(self, gyro_stream: MuseStream, fig, axes, means, acquisition=None):
         self.fig = fig
         self.fig.canvas.mpl_connect("key_press_event", self.OnKeypress)
         self.fig.canvas.mpl_connect("close_event", self.stop_event)
@@ -16,12 +17,20 @@ class LSLViewer:
         self.gyro_stream = gyro_stream
         self.gyro_stream.setup_ax(axes)
         self.means = means
+        # * When an Acquisition thread feeds the stream the viewer only reads the window
+        self.acquisition = acquisition
 
-        # ? Choose the higher frecunecy
-        maxFreq = self.gyro_stream.sfreq
-        print("Maxima frecuencia", maxFreq)
-        self.display_every = int(0.1 / (12 / 255))
-        print("Se muestra cada: ", self.display_every * 0.2, "s")
+        # * Frames are bounded by time instead of by a chunk counter
+        self.frame_period = 1.0 / VIEWER_FPS
+        self.last_frame = 0
+        self.last_labels = 0
+        self.background = None
+        self.decimator = None
+        self.blit = self.fig.canvas.supports_blit
+        for line in self.gyro_stream.lines:
+            line.set_animated(self.blit)
+        self.fig.canvas.mpl_connect("draw_event", self.on_draw)
+        print("Se muestra a", VIEWER_FPS, "fps")
         help_str = """
             toogle full screen : f
             zoom out : /
@@ -42,63 +51,69 @@ class LSLViewer:
             if self.gyro_stream.window > 1:
                 self.gyro_stream.window -= 1
 
+    def on_draw(self, event):
+        # * Full redraws refresh the cached background (axes, ticks, labels)
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_lines()
+
+    def draw_lines(self):
+        for line in self.gyro_stream.lines:
+            self.gyro_stream.axes.draw_artist(line)
+
+    def render(self, offset):
+        # * Only the samples that arrived since the last frame are copied from
+        # * the window, `offset` is what is subtracted from the raw or filtered
+        # * samples for display (applied after decimation, it's much smaller)
+        muse_stream = self.gyro_stream
+        width = int(muse_stream.axes.get_window_extent().width)
+        self.decimator = follow(self.decimator, muse_stream, width)
+        points, values = self.decimator.points()
+        x = points - self.decimator.last_time
+        y = (values - offset) / muse_stream.scale
+        for ii in range(muse_stream.n_chan):
+            muse_stream.lines[ii].set_data(x[:, ii], y[:, ii])
+
+        now = perf_counter()
+        full_redraw = (
+            not self.blit
+            or self.background is None
+            or now - self.last_labels >= LABELS_PERIOD
+        )
+        if full_redraw:
+            # * Tick labels and limits change slowly, only redraw them at a low rate
+            # * Removing the calibration offset doesn't change the std
+            impedances = muse_stream.window_std()
+            ticks_labels = [
+                "%s - %.2f" % (muse_stream.ch_names[ii], impedances[ii])
+                for ii in range(muse_stream.n_chan)
+            ]
+            muse_stream.axes.set_yticklabels(ticks_labels)
+            muse_stream.axes.set_xlim(-muse_stream.window, 0)
+            self.fig.canvas.draw()
+            self.last_labels = now
+        else:
+            self.fig.canvas.restore_region(self.background)
+            self.draw_lines()
+            self.fig.canvas.blit(self.fig.bbox)
+        self.fig.canvas.flush_events()
+
     def update_plot(self):
-        k = 0
         try:
             while self.started:
                 muse_stream = self.gyro_stream
-                samples, timestamps = self.gyro_stream.inlet.pull_chunk(
-                    timeout=0.1, max_samples=LSL_EEG_CHUNK
-                )
-                if timestamps:
-                    timestamps = np.float64(np.arange(len(timestamps)))
-                    timestamps /= muse_stream.sfreq
-                    timestamps += muse_stream.times[-1] + 1.0 / muse_stream.sfreq
-
-                    # muse_stream.times = np.concatenate(
-                    #     [muse_stream.times, timestamps]
-                    # )
-                    muse_stream.n_samples = int(muse_stream.sfreq * muse_stream.window)
-                    muse_stream.times = muse_stream.times[-muse_stream.n_samples :]
-
-                    muse_stream.data = np.vstack([muse_stream.data, samples])
-                    muse_stream.data = muse_stream.data[-muse_stream.n_samples :]
+                if self.acquisition is not None:
+                    sleep(max(self.frame_period - (perf_counter() - self.last_frame), 0))
+                else:
+                    samples, timestamps = muse_stream.pull(timeout=0.1)
+                    if not len(timestamps):
+                        continue
 
-                    if k == self.display_every:
-                        media = muse_stream.data.mean(axis=0)
-                        media = 0
-                        plot_data = muse_stream.data - self.means
-                        print(f"Mean: {media}")
-                        for ii in range(muse_stream.n_chan):
-                            if muse_stream.type == "GYRO":
-                                print(
-                                    f"{muse_stream.ch_names[ii]}:",
-                                    plot_data[-1, ii],
-                                    end=" ",
-                                )
-                            muse_stream.lines[ii].set_xdata(
-                                muse_stream.times[:: muse_stream.subsample]
-                                - muse_stream.times[-1]
-                            )
-                            muse_stream.lines[ii].set_ydata(
-                                plot_data[:: muse_stream.subsample, ii]
-                                / muse_stream.scale
-                                - 0
-                            )
-                            impedances = np.std(plot_data, axis=0)
-                        print("")
-                        ticks_labels = [
-                            "%s - %.2f" % (muse_stream.ch_names[ii], impedances[ii])
-                            for ii in range(muse_stream.n_chan)
-                        ]
-                        muse_stream.axes.set_yticklabels(ticks_labels)
-                        muse_stream.axes.set_xlim(-muse_stream.window, 0)
-                        self.fig.canvas.draw()
-                        k = 0
-                    else:
-                        # sleep(0.2)
-                        pass
-                    k += 1
+                now = perf_counter()
+                if now - self.last_frame >= self.frame_period:
+                    self.last_frame = now
+                    # * One copy of the new samples per frame: the acquisition
+                    # * thread keeps appending to the window while it is drawn
+                    self.render(0 if muse_stream.filt else self.means)
             print("End")
         except RuntimeError as e:
             raise
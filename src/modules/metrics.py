@@ -0,0 +1,158 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from bisect import bisect_left
+from time import sleep
+import json
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SIZE_BUCKETS = (1, 2, 4, 8, 12, 16, 32, 64, 128)
+
+# * Updates are not locked: a lost increment between threads is acceptable for
+# * telemetry and keeps the per-chunk cost to a few attribute writes
+
+
+class NullMetric:
+    # * Returned while metrics are disabled, every call is a no-op
+    def inc(self, amount: float = 1):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+
+NULL_METRIC = NullMetric()
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def samples(self, name: str, labels: str):
+        yield name + labels, self.value
+
+    def to_json(self):
+        return self.value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: str):
+        cumulative = 0
+        inner = labels[1:-1] + "," if labels else ""
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{inner}le="{bound}"}}', cumulative
+        yield name + "_sum" + labels, self.sum
+        yield name + "_count" + labels, self.count
+
+    def to_json(self):
+        return {"count": self.count, "sum": self.sum, "buckets": dict(zip(map(str, self.buckets + ("+Inf",)), self.counts))}
+
+
+class Registry:
+    def __init__(self):
+        self.enabled = False
+        # * name -> (kind, help, {labels: metric})
+        self.metrics = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def get(self, cls, name: str, help: str, labels: dict = None, **kwargs):
+        if not self.enabled:
+            return NULL_METRIC
+        kind, _, family = self.metrics.setdefault(name, (cls.kind, help, {}))
+        key = ",".join(f'{k}="{v}"' for k, v in sorted((labels or {}).items()))
+        key = "{" + key + "}" if key else ""
+        if key not in family:
+            family[key] = cls(**kwargs)
+        return family[key]
+
+    def counter(self, name: str, help: str, labels: dict = None):
+        return self.get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: dict = None):
+        return self.get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: dict = None, buckets=LATENCY_BUCKETS):
+        return self.get(Histogram, name, help, labels, buckets=buckets)
+
+    def to_prometheus(self):
+        lines = []
+        for name, (kind, help, family) in list(self.metrics.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in list(family.items()):
+                for sample, value in metric.samples(name, labels):
+                    lines.append(f"{sample} {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        return {
+            name: {labels or "": metric.to_json() for labels, metric in list(family.items())}
+            for name, (kind, help, family) in list(self.metrics.items())
+        }
+
+    def serve(self, port: int):
+        # * Prometheus text format on http://localhost:<port>/metrics
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
+
+    def dump_every(self, path: str, period: float):
+        def dump():
+            while True:
+                sleep(period)
+                with open(path, "w") as f:
+                    json.dump(self.to_json(), f, indent=2)
+
+        thread = Thread(target=dump)
+        thread.daemon = True
+        thread.start()
+
+
+# * Process wide registry, disabled until enable() is called
+registry = Registry()
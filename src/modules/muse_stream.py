@@ -1,12 +1,19 @@
-from pylsl import StreamInlet, resolve_streams, StreamInfo
-from modules.constants import LSL_EEG_CHUNK, SUBSAMPLE
+from pylsl import StreamInlet, StreamInfo
+from modules.constants import LSL_EEG_CHUNK, TIME_CORRECTION_PERIOD, SHARED_WINDOW
+from threading import Lock
+from time import perf_counter
+from modules.ring_buffer import RingBuffer
+from modules.recording import RecordingInlet
+from modules.gaps import GapTracker
+from modules.metrics import registry, SIZE_BUCKETS
 import numpy as np
 
 
 class MuseStream:
-    def __init__(self, stream: StreamInfo, filter: bool, scale: int, window: int):
+    def __init__(self, stream: StreamInfo, filter: bool, scale: int, window: int, inlet=None, labels: dict = None):
         self.stream = stream
-        self.inlet = StreamInlet(stream, max_chunklen=LSL_EEG_CHUNK)
+        # * Any object with the StreamInlet interface works, e.g. a ReplayInlet
+        self.inlet = inlet if inlet is not None else StreamInlet(stream, max_chunklen=LSL_EEG_CHUNK)
         self.info = self.inlet.info()
         description = self.info.desc()
         self.type = stream.type()
@@ -14,7 +21,6 @@ class MuseStream:
         self.n_samples = int(self.sfreq * window)
         self.n_chan = self.info.channel_count()
         self.filt = filter
-        self.subsample = SUBSAMPLE
         self.scale = scale
         self.window = window
 
@@ -25,27 +31,247 @@ class MuseStream:
             ch = ch.next_sibling()
             self.ch_names.append(ch.child_value("label"))
 
-    def setup_ax(self, ax):
         # * Set the initial data with only zeros and the channels of information
-        self.data = np.zeros((self.n_samples, self.n_chan))
-        self.times = np.arange(-self.window, 0, 1.0 / self.sfreq)
+        self.data_buffer = RingBuffer(self.n_samples, self.n_chan)
+        self.times_buffer = RingBuffer(self.n_samples)
+        self.times_buffer.append(np.arange(self.n_samples) / self.sfreq - self.window)
+        self.data_f_buffer = RingBuffer(self.n_samples, self.n_chan)
+        # * Held by push, readers on other threads go through snapshot()
+        self.lock = Lock()
+        # * Chunks go through the processing chain once, detection and the viewer
+        # * both use the result
+        self.pipeline = None
+        if filter:
+            # * scipy is only loaded when a stream is filtered
+            from modules.pipeline import default_pipeline
+
+            self.pipeline = default_pipeline(self.type, self.sfreq, self.n_chan)
+        self.received = 0
+        # * Extra metric labels, e.g. the session when several headsets share a process
+        labels = {**(labels or {}), "stream": self.type}
+        # * Samples missing before the chunk that was just read
+        self.gaps = GapTracker(self.sfreq, labels)
+        self.gap = 0
+        # * Shared memory ring mirrored on every push, for viewers in other processes
+        self.shared = None
+
+        # * Offset from the sender clock to the local LSL clock
+        self.time_offset = 0.0
+        self.corrected_at = None
+
+        self.metered = registry.enabled
+        self.pull_wait = registry.histogram("pedal_pull_wait_seconds", "Time blocked in pull_chunk", labels)
+        self.chunk_size = registry.histogram("pedal_chunk_samples", "Samples per pulled chunk", labels, SIZE_BUCKETS)
+        self.backlog = registry.gauge("pedal_inlet_backlog_samples", "Samples waiting in the inlet", labels)
+
+    def record(self, folder: str):
+        # * Every chunk pulled from now on is also written to `folder`
+        self.inlet = RecordingInlet(self.inlet, folder, self.ch_names)
+
+    def share(self, name: str, window: float = SHARED_WINDOW):
+        # * Lazy so processes that don't share never import multiprocessing
+        from modules.shared_ring import SharedRing
+
+        meta = {
+            "name": self.info.name(),
+            "type": self.type,
+            "sfreq": self.sfreq,
+            "n_chan": self.n_chan,
+            "ch_names": self.ch_names[: self.n_chan],
+            "filt": bool(self.filt),
+            "window": self.window,
+            "capacity": int(self.sfreq * window),
+        }
+        self.shared = SharedRing.create(name, meta)
+        return self.shared
+
+    def close(self):
+        # * Flush the recording and release the shared ring
+        if isinstance(self.inlet, RecordingInlet):
+            self.inlet.close()
+        if self.shared is not None:
+            self.shared.close()
+
+    def reattach(self, stream: StreamInfo):
+        # * The headset came back as a new outlet: only the inlet is replaced,
+        # * the window, the processing state and the calibration are kept
+        inlet = StreamInlet(stream, max_chunklen=LSL_EEG_CHUNK)
+        if inlet.info().channel_count() != self.n_chan:
+            raise RuntimeError(f"{self.type} stream came back with a different number of channels")
+        self.stream = stream
+        if isinstance(self.inlet, RecordingInlet):
+            self.inlet.inlet = inlet
+        else:
+            self.inlet = inlet
+        self.corrected_at = None
+
+    @property
+    def finished(self):
+        return getattr(self.inlet, "finished", False)
+
+    @property
+    def data(self):
+        return self.data_buffer.latest()
+
+    @property
+    def times(self):
+        return self.times_buffer.latest()
+
+    @property
+    def data_f(self):
+        return self.data_f_buffer.latest()
+
+    @property
+    def stats(self):
+        # * Mean/std/RMS per channel of the window, O(1) to read. Only the
+        # * viewer and the metrics pay for keeping them, headless detection doesn't
+        return self.data_buffer.track_stats()
+
+    @property
+    def stats_f(self):
+        return self.data_f_buffer.track_stats()
+
+    def snapshot(self):
+        # * Copy of the times and the shown samples (filtered or raw) of the
+        # * window, taken together. The buffers themselves are only safe to read
+        # * from the thread that pushes
+        with self.lock:
+            data = self.data_f_buffer if self.filt else self.data_buffer
+            return self.times_buffer.latest().copy(), data.latest().copy()
+
+    def snapshot_since(self, since: float):
+        # * Like snapshot, but only the samples newer than `since` (the last time
+        # * of an earlier snapshot) are copied, plus the length of the window.
+        # * None when the window already moved past `since`
+        with self.lock:
+            times = self.times_buffer.latest()
+            start = int(np.searchsorted(times, since, side="right"))
+            if start == 0:
+                return None
+            data = self.data_f_buffer if self.filt else self.data_buffer
+            return times[start:].copy(), data.latest(len(times) - start).copy(), len(times)
+
+    def window_std(self, filtered: bool = None):
+        filtered = self.filt if filtered is None else filtered
+        with self.lock:
+            return (self.stats_f if filtered else self.stats).std.copy()
+
+    def window_mean(self, filtered: bool = None):
+        filtered = self.filt if filtered is None else filtered
+        with self.lock:
+            return (self.stats_f if filtered else self.stats).mean.copy()
+
+    def update_time_offset(self):
+        # * Only the first estimate is slow, later ones are cached by liblsl
+        now = perf_counter()
+        if self.corrected_at is not None and now - self.corrected_at < TIME_CORRECTION_PERIOD:
+            return
+        try:
+            self.time_offset = self.inlet.time_correction(timeout=0.1)
+            self.corrected_at = now
+        except (TimeoutError, RuntimeError):
+            pass
+
+    def read(self, timeout: float = 0.1):
+        # * Pull a chunk without storing it, timestamps on the local LSL clock
+        if self.metered:
+            started = perf_counter()
+        try:
+            samples, timestamps = self.inlet.pull_chunk(timeout=timeout, max_samples=LSL_EEG_CHUNK)
+        except RuntimeError:
+            # * LostError, the source is gone until it is reattached
+            samples, timestamps = [], []
+        if self.metered:
+            self.pull_wait.observe(perf_counter() - started)
+            if timestamps:
+                self.chunk_size.observe(len(timestamps))
+                self.backlog.set(self.inlet.samples_available())
+        if timestamps:
+            self.update_time_offset()
+            timestamps = np.asarray(timestamps, dtype=np.float64) + self.time_offset
+            self.gap = self.gaps.check(timestamps)
+            if self.gap and self.gaps.is_long(self.gap) and self.pipeline is not None:
+                # * Filter state from before a dropout would ring on the jump
+                self.pipeline.reset()
+        return samples, timestamps
+
+    def pull(self, timeout: float = 0.1):
+        # * Pull a chunk and store it in the window, returns the (processed)
+        # * samples and their timestamps on the local LSL clock
+        samples, timestamps = self.read(timeout)
+        if len(timestamps):
+            if self.pipeline is not None:
+                filt_samples = self.pipeline.process(samples)
+                self.push(samples, timestamps, filt_samples)
+                return filt_samples, timestamps
+            self.push(samples, timestamps)
+        return samples, timestamps
+
+    @property
+    def valid(self):
+        # * Samples of the window that were actually received (not initial zeros)
+        return min(self.received, len(self.data_buffer))
+
+    def push(self, samples, timestamps, filt_samples=None):
+        with self.lock:
+            # * The window may have changed from the viewer keys, resize only then
+            n_samples = int(self.sfreq * self.window)
+            if n_samples != self.n_samples:
+                self.n_samples = n_samples
+                self.data_buffer.resize(n_samples)
+                self.times_buffer.resize(n_samples)
+                self.data_f_buffer.resize(n_samples)
+
+            received = self.received
+            if self.gap:
+                self.fill_gap(self.gap, samples, timestamps, filt_samples)
+                self.gap = 0
+            self.data_buffer.append(samples)
+            self.received += len(timestamps)
+            self.times_buffer.append(timestamps)
+            if filt_samples is not None:
+                self.data_f_buffer.append(filt_samples)
+            if self.shared is not None:
+                # * Copy what this push added, gap filling included
+                k = min(self.received - received, len(self.data_buffer))
+                filt = self.data_f_buffer.latest(k) if filt_samples is not None else None
+                self.shared.append(self.times_buffer.latest(k), self.data_buffer.latest(k), filt)
+
+    def fill_gap(self, missing: int, samples, timestamps, filt_samples=None):
+        # * Keep the window on a regular time axis: short gaps are linearly
+        # * interpolated, long ones are NaN so plots break the line there
+        last_time = self.times_buffer.last()
+        n = min(missing, self.n_samples)
+        step = (timestamps[0] - last_time) / (missing + 1)
+        times = timestamps[0] - np.arange(n, 0, -1) * step
+        if self.gaps.is_long(missing):
+            fraction = np.full((n, 1), np.nan)
+        else:
+            fraction = ((times - last_time) / (timestamps[0] - last_time))[:, None]
+
+        last = self.data_buffer.last()
+        self.data_buffer.append(last + fraction * (np.asarray(samples[0], dtype=np.float64) - last))
+        if filt_samples is not None:
+            last = self.data_f_buffer.last()
+            self.data_f_buffer.append(last + fraction * (filt_samples[0] - last))
+        self.times_buffer.append(times)
+        self.received += n
+
+    def setup_ax(self, ax):
         self.axes = ax
         self.lines = []
         for ii in range(self.n_chan):
-            (line,) = self.axes.plot(
-                self.times[::SUBSAMPLE], self.data[::SUBSAMPLE, ii] - ii, lw=1
-            )
+            # * The viewer fills the lines with the decimated window
+            (line,) = self.axes.plot([], [], lw=1)
             self.lines.append(line)
         self.axes.set_ylim(-self.n_chan + 0.5, 0.5)
         ticks = np.arange(0, -self.n_chan, -1)
-        self.impedances = np.std(self.data, axis=0)
+        self.impedances = self.window_std()
         ticks_labels = [
             "%s - %.1f" % (self.ch_names[ii], self.impedances[ii])
             for ii in range(self.n_chan)
         ]
 
-        self.bf, self.af, self.filt_state, self.data_f = None, None, None, None
-
         ax.set_yticklabels(ticks_labels)
         ax.set_xlabel("Time (s)")
         ax.set_ylabel(self.type)
@@ -0,0 +1,145 @@
+from scipy.signal import butter, firwin, lfilter, lfilter_zi
+from functools import lru_cache
+from numpy.lib.stride_tricks import sliding_window_view
+from abc import ABC, abstractmethod
+import numpy as np
+
+# * Coefficients only depend on the sample rate and the parameters, they are
+# * designed once and shared by every stage/stream that asks for them
+
+
+@lru_cache(maxsize=None)
+def design_fir_bandpass(sfreq: float, low: float, high: float, numtaps: int = 32):
+    b = firwin(numtaps, np.array([low, high]) / (sfreq / 2.0), width=0.05, pass_zero=False)
+    return b, np.array([1.0])
+
+
+@lru_cache(maxsize=None)
+def design_iir(sfreq: float, cutoff, btype: str, order: int = 2):
+    b, a = butter(order, np.asarray(cutoff) / (sfreq / 2.0), btype=btype)
+    return b, a
+
+
+class Stage(ABC):
+    # * A stage takes a (samples, channels) chunk and returns one of the same
+    # * shape, carrying whatever state it needs to the next chunk
+    @abstractmethod
+    def process(self, chunk):
+        pass
+
+    @abstractmethod
+    def reset(self):
+        pass
+
+
+class LFilter(Stage):
+    def __init__(self, b, a, n_chan: int):
+        self.b, self.a = b, a
+        self.n_chan = n_chan
+        self.reset()
+
+    def reset(self):
+        self.zi = None
+
+    def process(self, chunk):
+        if self.zi is None:
+            # * Start from the steady state of the first sample to avoid a step
+            self.zi = np.outer(lfilter_zi(self.b, self.a), chunk[0])
+        out, self.zi = lfilter(self.b, self.a, chunk, axis=0, zi=self.zi)
+        return out
+
+
+def fir_bandpass(sfreq: float, n_chan: int, low: float = 1, high: float = 40, numtaps: int = 32):
+    return LFilter(*design_fir_bandpass(sfreq, low, high, numtaps), n_chan)
+
+
+def iir_filter(sfreq: float, n_chan: int, cutoff, btype: str, order: int = 2):
+    return LFilter(*design_iir(sfreq, cutoff if np.isscalar(cutoff) else tuple(cutoff), btype, order), n_chan)
+
+
+def detrend(sfreq: float, n_chan: int, cutoff: float = 0.1):
+    # * First order high-pass, removes the offset and slow drift
+    return iir_filter(sfreq, n_chan, cutoff, "highpass", order=1)
+
+
+class MovingAverage(Stage):
+    def __init__(self, length: int, n_chan: int):
+        self.length = length
+        self.n_chan = n_chan
+        self.reset()
+
+    def reset(self):
+        self.tail = None
+
+    def process(self, chunk):
+        if self.tail is None:
+            self.tail = np.repeat(chunk[:1], self.length - 1, axis=0)
+        extended = np.vstack([self.tail, chunk])
+        cumsum = np.cumsum(extended, axis=0)
+        out = cumsum[self.length - 1 :].copy()
+        out[1:] -= cumsum[: -self.length]
+        self.tail = extended[len(extended) - (self.length - 1) :]
+        return out / self.length
+
+
+class Derivative(Stage):
+    def __init__(self, sfreq: float, span: int = 2):
+        # * Least-squares slope over the last `span` samples of every sample, in
+        # * units per second. With span 2 it is the plain difference, longer
+        # * spans follow the movement instead of the sensor noise
+        self.sfreq = sfreq
+        self.span = max(span, 2)
+        self.reset()
+
+    def reset(self):
+        # * Last span - 1 samples (and times) of the previous chunk
+        self.previous = None
+        self.previous_times = None
+
+    def process(self, chunk, timestamps=None):
+        # * Times default to the nominal rate, pass the real timestamps when
+        # * they are irregular
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if timestamps is None:
+            timestamps = np.arange(len(chunk)) / self.sfreq
+            if self.previous_times is not None and len(self.previous_times):
+                timestamps = timestamps + self.previous_times[-1] + 1 / self.sfreq
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if self.previous is None:
+            # * Start flat, as if the first sample had been there all along
+            self.previous = np.repeat(chunk[:1], self.span - 1, axis=0)
+            self.previous_times = timestamps[0] - np.arange(self.span - 1, 0, -1) / self.sfreq
+        extended = np.concatenate([self.previous, chunk])
+        times = np.concatenate([self.previous_times, timestamps])
+        self.previous = extended[len(extended) - (self.span - 1) :]
+        self.previous_times = times[len(times) - (self.span - 1) :]
+        t = sliding_window_view(times, self.span)
+        v = sliding_window_view(extended, self.span, axis=0)
+        t = t - t.mean(axis=1, keepdims=True)
+        v = v - v.mean(axis=-1, keepdims=True)
+        # * Windows are on the last axis of v, channels (if any) in between
+        t = t.reshape((len(t),) + (1,) * (v.ndim - 2) + (self.span,))
+        return (t * v).sum(axis=-1) / (t * t).sum(axis=-1)
+
+
+class Pipeline:
+    def __init__(self, stages: list[Stage]):
+        self.stages = stages
+
+    def process(self, chunk):
+        chunk = np.asarray(chunk, dtype=np.float64)
+        for stage in self.stages:
+            chunk = stage.process(chunk)
+        return chunk
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+
+
+def default_pipeline(stream_type: str, sfreq: float, n_chan: int):
+    # * EEG: the 1-40 Hz band used by the viewers. Motion: drift removal plus a
+    # * light smoothing of the sensor noise
+    if stream_type == "EEG":
+        return Pipeline([fir_bandpass(sfreq, n_chan)])
+    return Pipeline([detrend(sfreq, n_chan), MovingAverage(3, n_chan)])
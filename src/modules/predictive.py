@@ -0,0 +1,119 @@
+from modules.constants import REFRACTORY_PERIOD, REBOUND_PERIOD, PREDICT_HORIZON, PREDICT_ONSET, PREDICT_MIN_CONFIDENCE, PREDICT_CONFIRM, SLOPE_SPAN, GYRO_SFREQ
+from modules.gesture_detector import GestureDetector, Detection
+from modules.pipeline import Derivative
+import numpy as np
+
+
+class PredictiveDetector(GestureDetector):
+    def __init__(
+        self,
+        refractory: float = REFRACTORY_PERIOD,
+        rebound: float = REBOUND_PERIOD,
+        horizon: float = PREDICT_HORIZON,
+        onset: float = PREDICT_ONSET,
+        min_confidence: float = PREDICT_MIN_CONFIDENCE,
+        confirm: float = PREDICT_CONFIRM,
+        span: int = SLOPE_SPAN,
+        sfreq: float = GYRO_SFREQ,
+    ):
+        # * Same pedals, refractory and rebound as GestureDetector, but a pedal
+        # * also fires when the rate extrapolated `horizon` ahead crosses the
+        # * threshold. Until the real rate crosses it too the toggle is only
+        # * provisional, a reversal before that cancels it
+        super().__init__(refractory, rebound)
+        self.horizon = horizon
+        self.onset = onset
+        self.min_confidence = min_confidence
+        self.confirm = confirm
+        # * Least-squares slope on the real timestamps, a difference of two
+        # * samples follows the sensor noise
+        self.derivative = Derivative(sfreq, span)
+        # * Calibration std of the checked channel, only plain threshold
+        # * crossings fire until it is known
+        self.noise = None
+        self.reset()
+
+    def calibrate(self, noise: float):
+        self.noise = noise
+
+    def reset(self):
+        super().reset()
+        # * The slope continues across chunks
+        self.derivative.reset()
+        # * (detection, pedal states before it fired) waiting for confirmation
+        self.pending = None
+
+    def save(self):
+        return [(pedal.state, pedal.fired_at, pedal.blocked_until) for pedal in self.pedals]
+
+    def restore(self, saved):
+        for pedal, (state, fired_at, blocked_until) in zip(self.pedals, saved):
+            pedal.state, pedal.fired_at, pedal.blocked_until = state, fired_at, blocked_until
+
+    def resolve(self, values, slope, timestamps, threshold: float, start: int):
+        # * Settle the pending toggle inside the chunk. Returns where scanning
+        # * continues, a cancel Detection if it was undone, or (len, None) while
+        # * it is still open
+        detection, saved = self.pending
+        sign = detection.pedal.sign
+        confirmed = sign * values[start:] >= threshold
+        reversal = (sign * slope[start:] < 0) | (timestamps[start:] - detection.timestamp > self.confirm)
+        n = len(values) - start
+        confirmed_at = int(confirmed.argmax()) if confirmed.any() else n
+        reversed_at = int(reversal.argmax()) if reversal.any() else n
+        if confirmed_at == reversed_at == n:
+            return len(values), None
+        self.pending = None
+        if confirmed_at <= reversed_at:
+            return start + confirmed_at, None
+        index = start + reversed_at
+        self.restore(saved)
+        return index + 1, Detection(detection.pedal, index, timestamps[index], values[index], 0.0, cancel=True)
+
+    def update_chunk(self, values, timestamps, threshold: float):
+        values = np.asarray(values, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        detections = []
+        if not len(timestamps):
+            return detections
+        slope = self.derivative.process(values, timestamps)
+        predicted = values + slope * self.horizon
+        # * A provisional toggle needs the rate well above the sensor noise and
+        # * close enough to the threshold to be worth sending
+        onset = np.inf if self.noise is None else max(self.onset * self.noise, self.min_confidence * threshold)
+        self.advance(timestamps[0])
+        start = 0
+        while start < len(values):
+            if self.pending is not None:
+                start, cancel = self.resolve(values, slope, timestamps, threshold, start)
+                if cancel is not None:
+                    detections.append(cancel)
+                continue
+
+            first, first_pedal = len(values), None
+            for pedal in self.pedals:
+                sign = pedal.sign
+                # * Only while the rate still rises, a pedal armed again while
+                # * the head is held past the threshold doesn't fire twice
+                rising_past = (sign * values[start:first] > threshold) | (
+                    (sign * predicted[start:first] > threshold) & (sign * values[start:first] > onset)
+                )
+                crossed = (
+                    rising_past
+                    & (sign * slope[start:first] > 0)
+                    & (timestamps[start:first] >= self.armed_at(pedal))
+                )
+                if crossed.any():
+                    first, first_pedal = start + int(crossed.argmax()), pedal
+            if first_pedal is None:
+                break
+            saved = self.save()
+            self.advance(timestamps[first])
+            self.fire(first_pedal, timestamps[first])
+            confidence = min(first_pedal.sign * values[first] / threshold, 1.0)
+            detection = Detection(first_pedal, first, timestamps[first], values[first], confidence)
+            detections.append(detection)
+            if confidence < 1.0:
+                self.pending = (detection, saved)
+            start = first + 1
+        return detections
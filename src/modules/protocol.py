@@ -0,0 +1,162 @@
+from modules.constants import (
+    BINARY_VERSION,
+    BINARY_FORMAT,
+    SET_CELESTINO_ON,
+    SET_CELESTINO_OFF,
+    SET_SOSTENUTO_ON,
+    SET_SOSTENUTO_OFF,
+    TOGGLE_CELESTINO,
+    TOGGLE_SOSTENUTO,
+    SETTINGS_SCHEMA,
+    MAX_PENDING_ACTIONS,
+    STATE_ECHO_TIMEOUT,
+)
+from collections import deque
+from time import time, perf_counter
+import random
+import math
+import struct
+import json
+
+# * (command when the pedal turns on, command when it turns off)
+SET_CODES = {
+    TOGGLE_CELESTINO: (SET_CELESTINO_ON, SET_CELESTINO_OFF),
+    TOGGLE_SOSTENUTO: (SET_SOSTENUTO_ON, SET_SOSTENUTO_OFF),
+}
+# * The firmware publishes each pedal state, retained, next to the actions topic
+STATE_NAMES = {
+    TOGGLE_CELESTINO: "celestina",
+    TOGGLE_SOSTENUTO: "sostenuto",
+}
+BINARY_SIZE = struct.calcsize(BINARY_FORMAT)
+
+
+def now_ms():
+    return int(time() * 1000) & 0xFFFFFFFF
+
+
+def state_topics(actions_topic: str):
+    # * adaptative-pedal/actions -> adaptative-pedal/celestina, same for sessions
+    base = actions_topic.rsplit("/", 1)[0]
+    return {f"{base}/{name}": action for action, name in STATE_NAMES.items()}
+
+
+class BinaryProtocol:
+    def __init__(self):
+        self.seq = 0
+        # * New on every run, the firmware restarts its sequence check when the
+        # * boot id changes instead of dropping the first commands as repeated
+        self.boot = random.getrandbits(16)
+        # * Pedals are taken as released until the firmware reports their state
+        self.states = {action: False for action in SET_CODES}
+        # * (state, sent at) of the commands the firmware hasn't reported back
+        self.unconfirmed = {action: deque(maxlen=MAX_PENDING_ACTIONS) for action in SET_CODES}
+
+    def encode(self, action: str):
+        # * Toggles become explicit set-state commands, so a repeated or reordered
+        # * packet can't leave the pedal in the wrong position. Nothing changes
+        # * until commit(), the packet can be rebuilt if the send fails
+        code = SET_CODES[action][1 if self.states[action] else 0]
+        seq = (self.seq + 1) & 0xFFFF
+        return struct.pack(BINARY_FORMAT, BINARY_VERSION, code, self.boot, seq, now_ms())
+
+    def commit(self, action: str):
+        self.states[action] = not self.states[action]
+        self.seq = (self.seq + 1) & 0xFFFF
+        self.unconfirmed[action].append((self.states[action], perf_counter()))
+
+    def report(self, action: str, state: bool):
+        # * The firmware publishes the state after every command. Reports of our
+        # * own commands are consumed in order; with none left to confirm (or
+        # * only stale ones) the report wins: pedal restarted, another client,
+        # * or the state retained from before this run
+        unconfirmed = self.unconfirmed[action]
+        while unconfirmed and perf_counter() - unconfirmed[0][1] > STATE_ECHO_TIMEOUT:
+            unconfirmed.popleft()
+        if any(sent == state for sent, _ in unconfirmed):
+            while unconfirmed.popleft()[0] != state:
+                pass
+        elif not unconfirmed:
+            self.states[action] = state
+
+
+def decode(payload: bytes):
+    # * Returns (action code, boot id, sequence, sender time in ms)
+    if len(payload) != BINARY_SIZE:
+        raise ValueError(f"Binary action must be {BINARY_SIZE} bytes, got {len(payload)}")
+    version, code, boot, seq, sent_ms = struct.unpack(BINARY_FORMAT, payload)
+    if version != BINARY_VERSION:
+        raise ValueError(f"Unknown binary protocol version {version:#x}")
+    return code, boot, seq, sent_ms
+
+
+def one_way_latency(sent_ms: int):
+    # * Only meaningful when both clocks are synchronised (NTP)
+    return (now_ms() - sent_ms) & 0xFFFFFFFF
+
+
+class SequenceCheck:
+    # * Same check as the firmware: a packet is new when its sequence is ahead of
+    # * the last one from the same boot. Counts what a receiver would drop
+    def __init__(self):
+        self.boot = None
+        self.last = 0
+        self.received = 0
+        self.repeated = 0
+        self.reordered = 0
+        self.skipped = 0
+        self.restarts = 0
+
+    def check(self, boot: int, seq: int):
+        self.received += 1
+        if boot != self.boot:
+            if self.boot is not None:
+                self.restarts += 1
+            self.boot, self.last = boot, seq
+            return True
+        diff = (seq - self.last) & 0xFFFF
+        if diff == 0:
+            self.repeated += 1
+            return False
+        if diff >= 0x8000:
+            self.reordered += 1
+            return False
+        self.skipped += diff - 1
+        self.last = seq
+        return True
+
+    def __str__(self):
+        return f"{self.received} received, {self.repeated} repeated, {self.reordered} reordered, {self.skipped} skipped, {self.restarts} sender restarts"
+
+
+def parse_settings(raw: bytes):
+    # * Returns (action, value) or raises ValueError for anything off schema
+    try:
+        payload = json.loads(raw.decode())
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Settings are not valid JSON: {e}")
+    if not isinstance(payload, dict) or payload.get("action") not in SETTINGS_SCHEMA:
+        raise ValueError(f"Unknown settings action in {payload}")
+    action = payload["action"]
+    read = SETTINGS_SCHEMA[action]
+    if read is None:
+        return action, None
+    if "value" not in payload:
+        raise ValueError(f"{action} needs a value")
+    value = payload["value"]
+    if isinstance(read, tuple):
+        if value not in read:
+            raise ValueError(f"{action} must be one of {', '.join(read)}, got {value!r}")
+        return action, value
+    # * bool is an int: {"value": true} must not become a threshold of 1
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid value for {action}: {value!r}")
+    try:
+        value = read(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"Invalid value for {action}: {payload['value']!r}")
+    if not math.isfinite(value):
+        raise ValueError(f"Invalid value for {action}: {payload['value']!r}")
+    if value <= 0:
+        raise ValueError(f"{action} must be positive")
+    return action, value
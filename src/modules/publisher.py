@@ -0,0 +1,124 @@
+from modules.constants import ACTIONS_TOPIC, DEFAULT_QOS, MAX_PENDING_ACTIONS
+from modules.metrics import registry
+from modules.protocol import state_topics
+from collections import deque
+from threading import RLock
+from time import perf_counter
+import numpy as np
+import paho.mqtt.client as mqtt
+import socket
+
+
+class ActionPublisher:
+    def __init__(self, client, topic: str = ACTIONS_TOPIC, qos: int = DEFAULT_QOS, protocol=None, lock=None, early_acks: set = None, labels: dict = None):
+        self.client = client
+        self.topic = topic
+        self.qos = qos
+        # * Turns an action into the payload when it is sent, plain strings otherwise
+        self.protocol = protocol
+        # * Set-state commands follow the pedal states the firmware reports
+        self.state_topics = state_topics(topic) if protocol is not None else {}
+        self.connected = False
+        # * Publishers sharing a client must share the lock and the early acks too,
+        # * message ids are unique per client, not per publisher
+        self.lock = lock if lock is not None else RLock()
+        # * Actions waiting for a connection, bounded so a long outage can't grow it
+        self.queue = deque(maxlen=MAX_PENDING_ACTIONS)
+        # * mid -> (action, sent at) of the messages handed to paho and not acked.
+        # * paho resends them itself after a reconnect (persistent session)
+        self.in_flight = {}
+        self.early_acks = early_acks if early_acks is not None else set()
+        self.latencies = deque(maxlen=1000)
+        self.dropped = 0
+        self.coalesced = 0
+        self.ack_latency = registry.histogram("pedal_publish_ack_seconds", "Time from publish to broker ack", labels)
+
+    def on_connect(self, client):
+        sock = client.socket()
+        if sock is not None:
+            # * Pedal actions are tiny, don't let Nagle hold them back
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        for state_topic in self.state_topics:
+            client.subscribe(state_topic)
+        with self.lock:
+            self.connected = True
+            self.flush()
+
+    def on_disconnect(self):
+        with self.lock:
+            self.connected = False
+
+    def on_publish(self, mid: int):
+        with self.lock:
+            if mid in self.in_flight:
+                action, sent_at = self.in_flight.pop(mid)
+                latency = perf_counter() - sent_at
+                self.latencies.append(latency)
+                self.ack_latency.observe(latency)
+            else:
+                # * The ack can arrive before publish() returned the mid
+                self.early_acks.add(mid)
+
+    def on_state(self, topic: str, payload: bytes):
+        # * True when the message was a pedal state for this publisher
+        action = self.state_topics.get(topic)
+        if action is None:
+            return False
+        if payload in (b"true", b"false"):
+            with self.lock:
+                self.protocol.report(action, payload == b"true")
+        return True
+
+    def publish(self, action: str):
+        with self.lock:
+            if action in self.queue:
+                # * Two pending toggles of the same pedal cancel each other, sending
+                # * both late would only flash the pedal after the blip
+                self.queue.remove(action)
+                self.coalesced += 1
+                return
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(action)
+            if self.connected:
+                self.flush()
+
+    def flush(self):
+        while self.queue:
+            action = self.queue[0]
+            payload = self.protocol.encode(action) if self.protocol is not None else action
+            info = self.client.publish(self.topic, payload, qos=self.qos)
+            if info.rc == mqtt.MQTT_ERR_NO_CONN:
+                self.connected = False
+                if self.qos == 0:
+                    # * Lost the connection meanwhile, keep it for the next connect
+                    return
+                # * With QoS 1/2 paho stores the message and sends it on reconnect
+            elif info.rc != mqtt.MQTT_ERR_SUCCESS:
+                return
+            self.queue.popleft()
+            if self.protocol is not None:
+                self.protocol.commit(action)
+            if info.mid in self.early_acks:
+                self.early_acks.discard(info.mid)
+                self.latencies.append(0.0)
+                self.ack_latency.observe(0.0)
+            else:
+                self.in_flight[info.mid] = (action, perf_counter())
+
+    @property
+    def pending(self):
+        return len(self.queue) + len(self.in_flight)
+
+    def latency_percentiles(self):
+        if not self.latencies:
+            return None
+        return np.percentile(np.array(self.latencies), [50, 95, 99])
+
+    def __str__(self):
+        message = f"Publisher [{self.topic} qos {self.qos}]: {self.pending} pending, {self.dropped} dropped, {self.coalesced} coalesced"
+        percentiles = self.latency_percentiles()
+        if percentiles is not None:
+            p50, p95, p99 = percentiles * 1e3
+            message += f", ack latency p50 {p50:.1f} p95 {p95:.1f} p99 {p99:.1f} ms"
+        return message
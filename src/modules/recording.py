@@ -0,0 +1,152 @@
+from pylsl import StreamInfo
+from threading import Lock
+from time import sleep, perf_counter
+import numpy as np
+import json
+import os
+
+# * Every stream type of a session is stored as three files in the same folder:
+# *   <TYPE>.json        stream header (name, frequency, channels)
+# *   <TYPE>.data.bin    float64 samples, one row of n_chan values per sample
+# *   <TYPE>.times.bin   float64 LSL timestamps, one per sample
+# * Both .bin files are append only and can be memory mapped directly
+# * A session can also be labelled for offline tuning:
+# *   labels.json        [[onset timestamp, action], ...] of the real gestures
+
+
+def stream_paths(folder: str, stream_type: str):
+    base = os.path.join(folder, stream_type)
+    return base + ".json", base + ".data.bin", base + ".times.bin"
+
+
+def save_labels(folder: str, gestures: list):
+    with open(os.path.join(folder, "labels.json"), "w") as f:
+        json.dump([[float(onset), action] for onset, action in gestures], f, indent=2)
+
+
+def load_labels(folder: str):
+    with open(os.path.join(folder, "labels.json")) as f:
+        return [(onset, action) for onset, action in json.load(f)]
+
+
+def make_info(header: dict):
+    # * Rebuild an LSL StreamInfo so a replayed stream looks like a live one
+    info = StreamInfo(
+        header["name"], header["type"], header["n_chan"], header["sfreq"], "float32", header["source_id"]
+    )
+    channels = info.desc().append_child("channels")
+    for name in header["ch_names"]:
+        channels.append_child("channel").append_child_value("label", name)
+    return info
+
+
+class RecordingInlet:
+    def __init__(self, inlet, folder: str, ch_names: list[str]):
+        self.inlet = inlet
+        info = inlet.info()
+        self.n_chan = info.channel_count()
+        os.makedirs(folder, exist_ok=True)
+        header_path, data_path, times_path = stream_paths(folder, info.type())
+        header = {
+            "name": info.name(),
+            "type": info.type(),
+            "source_id": info.source_id(),
+            "sfreq": info.nominal_srate(),
+            "n_chan": self.n_chan,
+            "ch_names": ch_names[: self.n_chan],
+        }
+        # * Exclusive create: appending to an older recording would silently
+        # * join two runs in one session
+        with open(header_path, "x") as f:
+            json.dump(header, f, indent=2)
+        self.data_file = open(data_path, "xb")
+        self.times_file = open(times_path, "xb")
+        # * The acquisition thread writes while the main thread may close
+        self.lock = Lock()
+
+    def info(self):
+        return self.inlet.info()
+
+    def time_correction(self, *args, **kwargs):
+        return self.inlet.time_correction(*args, **kwargs)
+
+    def samples_available(self):
+        return self.inlet.samples_available()
+
+    @property
+    def finished(self):
+        # * Recording a replayed session ends with it
+        return getattr(self.inlet, "finished", False)
+
+    def pull_chunk(self, timeout: float = 0.0, max_samples: int = 1024):
+        samples, timestamps = self.inlet.pull_chunk(timeout=timeout, max_samples=max_samples)
+        if timestamps:
+            with self.lock:
+                if not self.data_file.closed:
+                    np.asarray(samples, dtype=np.float64).reshape(-1, self.n_chan).tofile(self.data_file)
+                    np.asarray(timestamps, dtype=np.float64).tofile(self.times_file)
+        return samples, timestamps
+
+    def close(self):
+        with self.lock:
+            self.data_file.close()
+            self.times_file.close()
+
+
+class ReplayInlet:
+    def __init__(self, folder: str, stream_type: str, realtime: bool = True):
+        header_path, data_path, times_path = stream_paths(folder, stream_type)
+        with open(header_path) as f:
+            self.header = json.load(f)
+        self.stream_info = make_info(self.header)
+        # * A session that was killed can end with one file a chunk longer than
+        # * the other, only the samples present in both are replayed
+        n_chan = self.header["n_chan"]
+        row = np.dtype(np.float64).itemsize
+        n = min(os.path.getsize(times_path) // row, os.path.getsize(data_path) // (row * n_chan))
+        if n:
+            self.times = np.memmap(times_path, dtype=np.float64, mode="r", shape=(n,))
+            self.data = np.memmap(data_path, dtype=np.float64, mode="r", shape=(n, n_chan))
+        else:
+            self.times = np.empty(0)
+            self.data = np.empty((0, n_chan))
+        self.realtime = realtime
+        self.position = 0
+        self.started_at = None
+
+    def info(self):
+        return self.stream_info
+
+    def time_correction(self, *args, **kwargs):
+        return 0.0
+
+    @property
+    def finished(self):
+        return self.position >= len(self.times)
+
+    def samples_available(self):
+        return len(self.times) - self.position
+
+    def pull_chunk(self, timeout: float = 0.0, max_samples: int = 1024):
+        if self.finished:
+            return [], []
+        end = min(self.position + max_samples, len(self.times))
+        if self.realtime:
+            # * Only hand out the samples that would already exist on a live inlet.
+            # * Like pylsl, wait until `max_samples` are due or the timeout expires
+            if self.started_at is None:
+                self.started_at = perf_counter() - self.times[self.position]
+            now = perf_counter() - self.started_at
+            wait = self.times[end - 1] - now
+            if wait > timeout:
+                sleep(timeout)
+                now += timeout
+                end = self.position + int(np.searchsorted(self.times[self.position : end], now, side="right"))
+                if end == self.position:
+                    return [], []
+            elif wait > 0:
+                sleep(wait)
+        samples = self.data[self.position : end]
+        timestamps = self.times[self.position : end].tolist()
+        self.position = end
+        return samples, timestamps
@@ -0,0 +1,100 @@
+from modules.rolling_stats import RollingStats
+import numpy as np
+
+
+class RingBuffer:
+    def __init__(self, capacity: int, n_chan: int = None, fill: float = 0.0, dtype=np.float64):
+        self.n_chan = n_chan
+        self.fill = fill
+        self.dtype = dtype
+        # * Per channel mean/std/RMS of the window, only kept once someone asks
+        self.stats = None
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        # * The storage is mirrored (2 * capacity) so the latest samples are
+        # * always a contiguous slice and can be returned without copying
+        self.capacity = max(int(capacity), 1)
+        shape = (2 * self.capacity,) if self.n_chan is None else (2 * self.capacity, self.n_chan)
+        self.buf = np.full(shape, self.fill, dtype=self.dtype)
+        self.head = 0
+        self.count = self.capacity
+        if self.stats is not None:
+            self.stats.rebuild(self.latest())
+
+    def __len__(self):
+        return self.count
+
+    def append(self, chunk):
+        chunk = np.asarray(chunk, dtype=self.dtype)
+        k = len(chunk)
+        if k == 0:
+            return
+        cap = self.capacity
+        if k >= cap:
+            # * Only the last `capacity` samples survive, restart at the origin
+            chunk = chunk[-cap:]
+            self.buf[:cap] = chunk
+            self.buf[cap:] = chunk
+            self.head = 0
+            self.count = cap
+            if self.stats is not None:
+                self.stats.rebuild(chunk)
+            return
+
+        if self.stats is not None:
+            # * The oldest samples are overwritten, take them out first
+            leaving = self.count + k - cap
+            if leaving > 0:
+                self.stats.remove(self.latest()[:leaving])
+            self.stats.add(chunk)
+
+        end = self.head + k
+        if end <= cap:
+            self.buf[self.head : end] = chunk
+            self.buf[self.head + cap : end + cap] = chunk
+        else:
+            first = cap - self.head
+            self.buf[self.head : cap] = chunk[:first]
+            self.buf[self.head + cap :] = chunk[:first]
+            self.buf[: k - first] = chunk[first:]
+            self.buf[cap : cap + k - first] = chunk[first:]
+        self.head = end % cap
+        self.count = min(self.count + k, cap)
+        if self.stats is not None and self.stats.since_rebuild >= cap:
+            # * Once per window length, amortized O(1) per sample
+            self.stats.rebuild(self.latest())
+
+    def latest(self, n: int = None):
+        # * Zero-copy view of the last n samples, oldest first. The view is
+        # * only valid until the next append
+        if n is None or n > self.count:
+            n = self.count
+        end = self.head + self.capacity
+        return self.buf[end - n : end]
+
+    def track_stats(self):
+        # * Starts keeping the stats up to date on append. A chunk appended by
+        # * another thread meanwhile is missed until the next rebuild
+        if self.stats is None:
+            stats = RollingStats(self.n_chan or 1)
+            stats.rebuild(self.latest())
+            self.stats = stats
+        return self.stats
+
+    def last(self):
+        return self.buf[self.head + self.capacity - 1]
+
+    def resize(self, capacity: int):
+        capacity = max(int(capacity), 1)
+        if capacity == self.capacity:
+            return
+        # * Keep the most recent samples, the window grows back as new ones arrive
+        kept = self.latest(min(capacity, self.count)).copy()
+        self._allocate(capacity)
+        self.count = len(kept)
+        self.buf[capacity - len(kept) : capacity] = kept
+        self.buf[2 * capacity - len(kept) :] = kept
+        self.head = 0
+        if self.stats is not None:
+            self.stats.rebuild(kept)
@@ -0,0 +1,64 @@
+import numpy as np
+
+
+class RollingStats:
+    def __init__(self, n_chan: int):
+        # * Per channel count, sum and sum of squares of the samples inside a
+        # * window, updated as samples enter and leave. The sums are taken around
+        # * a shift (the mean at the last rebuild) so the variance doesn't lose
+        # * precision when the offset is large compared to the noise. NaN samples
+        # * (gaps) are left out like np.nanstd does
+        self.n_chan = n_chan
+        self.rebuild(np.zeros((0, n_chan)))
+
+    def rebuild(self, window):
+        # * Exact recomputation, also clears the rounding accumulated by add/remove
+        window = np.asarray(window, dtype=np.float64).reshape(-1, self.n_chan)
+        valid = ~np.isnan(window)
+        n = valid.sum(axis=0)
+        total = np.where(valid, window, 0.0).sum(axis=0)
+        self.shift = np.divide(total, n, out=np.zeros(self.n_chan), where=n > 0)
+        self.n, self.sum, self.sum_sq = self.sums(window)
+        self.n = np.broadcast_to(self.n, (self.n_chan,)).copy()
+        self.since_rebuild = 0
+
+    def sums(self, chunk):
+        centered = np.asarray(chunk, dtype=np.float64).reshape(-1, self.n_chan) - self.shift
+        total = centered.sum(axis=0)
+        if not np.isnan(total).any():
+            return len(centered), total, (centered * centered).sum(axis=0)
+        valid = ~np.isnan(centered)
+        centered = np.where(valid, centered, 0.0)
+        return valid.sum(axis=0), centered.sum(axis=0), (centered * centered).sum(axis=0)
+
+    def add(self, chunk):
+        n, total, total_sq = self.sums(chunk)
+        self.n += n
+        self.sum += total
+        self.sum_sq += total_sq
+        self.since_rebuild += len(chunk)
+
+    def remove(self, chunk):
+        n, total, total_sq = self.sums(chunk)
+        self.n -= n
+        self.sum -= total
+        self.sum_sq -= total_sq
+
+    @property
+    def mean(self):
+        return self.shift + np.divide(self.sum, self.n, out=np.full(self.n_chan, np.nan), where=self.n > 0)
+
+    @property
+    def var(self):
+        mean = np.divide(self.sum, self.n, out=np.full(self.n_chan, np.nan), where=self.n > 0)
+        mean_sq = np.divide(self.sum_sq, self.n, out=np.full(self.n_chan, np.nan), where=self.n > 0)
+        return np.maximum(mean_sq - mean * mean, 0.0)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    @property
+    def rms(self):
+        mean = self.mean
+        return np.sqrt(self.var + mean * mean)
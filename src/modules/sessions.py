@@ -0,0 +1,176 @@
+from modules.constants import SESSION_TOPIC_PREFIX, SESSION_WORKERS, DEFAULT_QOS, RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY
+from modules.muse_stream import MuseStream
+from modules.acquisition import Acquisition
+from modules.settings import Settings
+from modules.publisher import ActionPublisher
+from modules.protocol import BinaryProtocol
+from modules.metrics import registry
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from threading import RLock, Lock
+from time import perf_counter
+import numpy as np
+
+
+def session_id(stream):
+    # * Headsets are told apart by their source_id (e.g. the Muse address)
+    return stream.source_id() or stream.uid()
+
+
+def session_topics(session_id: str):
+    base = f"{SESSION_TOPIC_PREFIX}/{session_id}"
+    return base + "/settings", base + "/actions"
+
+
+class Session:
+    # * One headset driving one pedal rig: its own stream, settings, calibration,
+    # * detector and actions topic. Also what Gyro expects as its connection
+    def __init__(self, server, muse_stream: MuseStream, make_gyro):
+        self.server = server
+        self.muse_stream = muse_stream
+        self.id = session_id(muse_stream.stream)
+        self.settings_topic, self.actions_topic = session_topics(self.id)
+        self.settings = server.make_settings()
+        labels = {"session": self.id}
+        protocol = BinaryProtocol() if server.binary else None
+        self.publisher = ActionPublisher(
+            server.client, self.actions_topic, server.qos, protocol, server.lock, server.early_acks, labels
+        )
+
+        # * Chunks arrive on the acquisition thread and are processed on the
+        # * shared pool, never more than one task per session at a time
+        self.acquisition = Acquisition(muse_stream)
+        self.queue = self.acquisition.subscribe(on_put=self.schedule)
+        self.gyro = make_gyro(muse_stream, self, queue=self.queue, labels=labels)
+        self.busy = False
+        self.busy_lock = Lock()
+        self.latencies = deque(maxlen=1000)
+        self.latency = registry.histogram("pedal_session_chunk_seconds", "Detection time per chunk on the session pool, without the queue wait", labels)
+
+    def publish_action(self, action):
+        self.publisher.publish(action)
+
+    def start(self):
+        print(f"[{self.id}] Calibrating...")
+        self.gyro.calibrator.start()
+        self.acquisition.start()
+
+    def schedule(self):
+        with self.busy_lock:
+            if self.busy:
+                return
+            self.busy = True
+        self.server.pool.submit(self.drain)
+
+    def drain(self):
+        # * Process what is queued and give the worker back, a slow session only
+        # * holds one worker and its bounded queue drops its own oldest chunks
+        try:
+            while len(self.queue):
+                started = perf_counter()
+                samples, timestamps = self.queue.get(timeout=0)
+                if len(timestamps):
+                    for detection in self.gyro.process(samples, timestamps):
+                        self.publish_action(detection.action)
+                elapsed = perf_counter() - started
+                self.latencies.append(elapsed)
+                self.latency.observe(elapsed)
+        except Exception as e:
+            print(f"❌ [{self.id}] {e!r}")
+        finally:
+            with self.busy_lock:
+                self.busy = False
+        # * A chunk may have arrived between the last check and clearing busy
+        if len(self.queue):
+            self.schedule()
+
+    def stop(self):
+        self.acquisition.stop()
+
+    def __str__(self):
+        message = f"Session [{self.id}] {self.settings_topic} -> {self.actions_topic}\n  {self.acquisition}\n  {self.muse_stream.gaps}\n  {self.publisher}"
+        if self.latencies:
+            p50, p99 = np.percentile(np.array(self.latencies), [50, 99]) * 1e3
+            message += f"\n  Chunk processing p50 {p50:.3f} p99 {p99:.3f} ms"
+        return message
+
+
+class SessionServer:
+    def __init__(self, client, make_gyro, qos: int = DEFAULT_QOS, binary: bool = False, workers: int = SESSION_WORKERS, make_settings=Settings):
+        # * One MQTT client and one worker pool for every session in the process
+        self.client = client
+        self.make_gyro = make_gyro
+        self.make_settings = make_settings
+        self.qos = qos
+        self.binary = binary
+        self.lock = RLock()
+        self.early_acks = set()
+        self.sessions: dict[str, Session] = {}
+        self.by_topic: dict[str, Session] = {}
+        self.connected = False
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="session")
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_message = self.on_message
+        self.client.on_publish = self.on_publish
+        self.client.reconnect_delay_set(min_delay=RECONNECT_MIN_DELAY, max_delay=RECONNECT_MAX_DELAY)
+
+    def __contains__(self, session_id: str):
+        return session_id in self.sessions
+
+    def add(self, muse_stream: MuseStream):
+        if session_id(muse_stream.stream) in self.sessions:
+            return self.sessions[session_id(muse_stream.stream)]
+        session = Session(self, muse_stream, self.make_gyro)
+        with self.lock:
+            self.sessions[session.id] = session
+            self.by_topic[session.settings_topic] = session
+            if self.connected:
+                self.client.subscribe(session.settings_topic)
+                session.publisher.on_connect(self.client)
+        print(f"➕ Session {session.id}: settings on {session.settings_topic}, actions on {session.actions_topic}")
+        session.start()
+        return session
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        print(f"Connected with result code {reason_code}")
+        with self.lock:
+            self.connected = True
+            for session in self.sessions.values():
+                self.client.subscribe(session.settings_topic)
+                session.publisher.on_connect(client)
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties):
+        print(f"Disconnected with result code {reason_code}")
+        with self.lock:
+            self.connected = False
+            for session in self.sessions.values():
+                session.publisher.on_disconnect()
+
+    def on_message(self, client, userdata, msg):
+        session = self.by_topic.get(msg.topic)
+        if session is not None:
+            session.settings.handle(msg.payload)
+            return
+        with self.lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            if session.publisher.on_state(msg.topic, msg.payload):
+                return
+
+    def on_publish(self, client, userdata, mid, reason_code, properties):
+        with self.lock:
+            for session in self.sessions.values():
+                if mid in session.publisher.in_flight:
+                    session.publisher.on_publish(mid)
+                    return
+            # * Acked before publish() returned, the publisher that sent it finds it here
+            self.early_acks.add(mid)
+
+    def stop(self):
+        for session in self.sessions.values():
+            session.stop()
+        self.pool.shutdown(wait=True)
+
+    def __str__(self):
+        return "\n".join(str(session) for session in self.sessions.values())
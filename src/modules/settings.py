@@ -0,0 +1,52 @@
+from modules.constants import DEFAULT_THRESHOLD, DEFAULT_NOISE_FACTOR
+from modules.threshold import FIXED
+from modules.protocol import parse_settings
+from collections import deque
+
+
+class Settings:
+    def __init__(self, threshold_mode: str = FIXED, noise_factor: float = DEFAULT_NOISE_FACTOR):
+        self.threshold = DEFAULT_THRESHOLD
+        self.threshold_mode = threshold_mode
+        self.noise_factor = noise_factor
+        self.calibrate = False
+        # * Changes come from the MQTT callback and wait here until the detection
+        # * loop applies them between two chunks (deque append/popleft are atomic)
+        self.pending = deque()
+
+    def submit(self, **changes):
+        self.pending.append(changes)
+
+    def handle(self, payload: bytes):
+        # * A settings message from MQTT, validated and queued for the detection loop
+        try:
+            action, value = parse_settings(payload)
+        except ValueError as e:
+            print(f"❌ Ignored settings: {e}")
+            return
+
+        if action == "CHANGE_THRESHOLD":
+            print(f"✅ Threshold changed to {value}")
+            self.submit(threshold=value)
+        elif action == "DEFAULT_THRESHOLD":
+            print(f"✅ Threshold changed to default value {DEFAULT_THRESHOLD}")
+            self.submit(threshold=DEFAULT_THRESHOLD)
+        elif action == "CALIBRATE":
+            print(f"⚙️  Calibrating")
+            self.submit(calibrate=True)
+        elif action == "THRESHOLD_MODE":
+            print(f"✅ Threshold mode changed to {value}")
+            self.submit(threshold_mode=value)
+        elif action == "CHANGE_NOISE_FACTOR":
+            print(f"✅ Noise factor changed to {value}")
+            self.submit(noise_factor=value)
+
+    def apply(self):
+        while self.pending:
+            for name, value in self.pending.popleft().items():
+                setattr(self, name, value)
+
+    def take_calibrate(self):
+        calibrate = self.calibrate
+        self.calibrate = False
+        return calibrate
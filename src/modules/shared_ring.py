@@ -0,0 +1,197 @@
+from modules.muse_stream import MuseStream
+from modules.constants import SNAPSHOT_TIMEOUT
+from multiprocessing import shared_memory, resource_tracker
+from time import perf_counter, sleep
+import numpy as np
+import json
+
+# * Layout of the shared block:
+# *   META_SIZE bytes   JSON header (name, type, sfreq, channels, capacity, filt)
+# *   int64[4]          seq, head, count, written
+# *   float64[n_chan]   display offsets (calibration mean)
+# *   float64[2 * capacity]           times
+# *   float64[2 * capacity, n_chan]   raw samples
+# *   float64[2 * capacity, n_chan]   filtered samples
+# * Arrays are mirrored like RingBuffer so the latest window is one contiguous
+# * slice. `seq` is odd while the writer is in the middle of an append
+META_SIZE = 4096
+SEQ, HEAD, COUNT, WRITTEN = range(4)
+
+
+class SharedRing:
+    def __init__(self, shm: shared_memory.SharedMemory, meta: dict, owner: bool):
+        self.shm = shm
+        self.meta = meta
+        self.owner = owner
+        self.capacity = meta["capacity"]
+        self.n_chan = meta["n_chan"]
+        offset = META_SIZE
+        self.header = np.ndarray((4,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.header.nbytes
+        self.offsets = np.ndarray((self.n_chan,), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += self.offsets.nbytes
+        self.times = np.ndarray((2 * self.capacity,), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += self.times.nbytes
+        self.data = np.ndarray((2 * self.capacity, self.n_chan), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += self.data.nbytes
+        self.data_f = np.ndarray((2 * self.capacity, self.n_chan), dtype=np.float64, buffer=shm.buf, offset=offset)
+        if not owner:
+            # * The mapping itself is read-write, readers must not write through it
+            for array in (self.header, self.offsets, self.times, self.data, self.data_f):
+                array.flags.writeable = False
+
+    @staticmethod
+    def size(capacity: int, n_chan: int):
+        return META_SIZE + 8 * (4 + n_chan + 2 * capacity * (1 + 2 * n_chan))
+
+    @classmethod
+    def create(cls, name: str, meta: dict):
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls.size(meta["capacity"], meta["n_chan"]))
+        encoded = json.dumps(meta).encode()
+        if len(encoded) > META_SIZE:
+            raise ValueError("Shared ring header too long")
+        shm.buf[: len(encoded)] = encoded
+        ring = cls(shm, meta, owner=True)
+        ring.header[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name: str):
+        shm = shared_memory.SharedMemory(name=name)
+        # * Before 3.13 the resource tracker of a process that only attaches
+        # * would unlink the block when that process exits
+        resource_tracker.unregister(shm._name, "shared_memory")
+        meta = json.loads(bytes(shm.buf[:META_SIZE]).rstrip(b"\0"))
+        return cls(shm, meta, owner=False)
+
+    @property
+    def written(self):
+        return int(self.header[WRITTEN])
+
+    def append(self, times, samples, filt_samples=None):
+        # * Single writer. Readers never block it, they check `seq` instead
+        k = len(times)
+        if k == 0:
+            return
+        cap = self.capacity
+        if k > cap:
+            times, samples = times[-cap:], samples[-cap:]
+            filt_samples = None if filt_samples is None else filt_samples[-cap:]
+        n = len(times)
+        head = int(self.header[HEAD])
+        self.header[SEQ] += 1
+        positions = (head + np.arange(n)) % cap
+        for target, chunk in ((self.times, times), (self.data, samples), (self.data_f, filt_samples)):
+            if chunk is not None:
+                target[positions] = chunk
+                target[positions + cap] = chunk
+        self.header[HEAD] = (head + n) % cap
+        self.header[COUNT] = min(int(self.header[COUNT]) + n, cap)
+        self.header[WRITTEN] += k
+        self.header[SEQ] += 1
+
+    def set_offsets(self, offsets):
+        self.offsets[:] = offsets
+
+    def snapshot(self, n: int = None, since: int = None, timeout: float = SNAPSHOT_TIMEOUT):
+        # * Copies of the last n samples (times, raw, filtered), oldest first,
+        # * plus the number of samples written when they were taken. With `since`
+        # * only the samples written after that count. The copy is kept only if
+        # * `seq` didn't move while it was made, otherwise it is taken again
+        deadline = perf_counter() + timeout
+        while True:
+            seq = int(self.header[SEQ])
+            if seq % 2:
+                # * A writer that died mid-append leaves `seq` odd forever
+                if perf_counter() >= deadline:
+                    raise TimeoutError("Shared ring writer stopped in the middle of an append")
+                sleep(0)
+                continue
+            head, count, written = int(self.header[HEAD]), int(self.header[COUNT]), int(self.header[WRITTEN])
+            size = count if n is None else min(n, count)
+            if since is not None:
+                size = min(size, written - since)
+            end = head + self.capacity
+            window = (
+                self.times[end - size : end].copy(),
+                self.data[end - size : end].copy(),
+                self.data_f[end - size : end].copy(),
+            )
+            if int(self.header[SEQ]) == seq:
+                return (*window, written)
+            if perf_counter() >= deadline:
+                raise TimeoutError("Shared ring kept changing while it was copied")
+
+    def close(self):
+        # * Drop the numpy views before closing the mapping
+        self.header = self.offsets = self.times = self.data = self.data_f = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedStream:
+    # * Read-only stand-in for MuseStream in a viewer process attached to a ring
+    def __init__(self, ring: SharedRing, scale: float = 1, window: float = None, poll: float = 0.005):
+        meta = ring.meta
+        self.ring = ring
+        self.type = meta["type"]
+        self.sfreq = meta["sfreq"]
+        self.n_chan = meta["n_chan"]
+        self.ch_names = meta["ch_names"]
+        self.filt = meta["filt"]
+        self.scale = scale
+        self.window = window or meta["window"]
+        # * Live view, follows the detector's recalibrations
+        self.means = ring.offsets
+        self.poll = poll
+        self.seen = ring.written
+        # * Last sample of the previous snapshot, for snapshot_since
+        self.shown_time = None
+        self.shown = 0
+
+    # * Plotting setup is the same as for a live stream
+    setup_ax = MuseStream.setup_ax
+
+    def latest(self):
+        # * One consistent copy of the window, (times, raw, filtered, written)
+        return self.ring.snapshot(int(self.sfreq * self.window))
+
+    def snapshot(self):
+        times, data, data_f, written = self.latest()
+        if len(times):
+            self.shown_time, self.shown = times[-1], written
+        return times, data_f if self.filt else data
+
+    def snapshot_since(self, since: float):
+        # * Same as MuseStream.snapshot_since, counted in samples written
+        n = int(self.sfreq * self.window)
+        if since != self.shown_time:
+            return None
+        times, data, data_f, written = self.ring.snapshot(n, since=self.shown)
+        if written - self.shown > n:
+            return None
+        if len(times):
+            self.shown_time, self.shown = times[-1], written
+        return times, data_f if self.filt else data, min(written, self.ring.capacity, n)
+
+    def window_std(self, filtered: bool = None):
+        filtered = self.filt if filtered is None else filtered
+        _, data, data_f, _ = self.latest()
+        return np.nanstd(data_f if filtered else data, axis=0)
+
+    def wait(self, timeout: float = None):
+        # * Block until the detector wrote something new
+        deadline = None if timeout is None else perf_counter() + timeout
+        while self.ring.written == self.seen:
+            if deadline is not None and perf_counter() >= deadline:
+                return False
+            sleep(self.poll)
+        return True
+
+    def pull(self, timeout: float = 0.1):
+        # * Copies of the samples written since the last pull
+        if not self.wait(timeout):
+            return [], []
+        times, data, data_f, self.seen = self.ring.snapshot(since=self.seen)
+        return data_f if self.filt else data, times
@@ -0,0 +1,157 @@
+from modules.muse_stream import MuseStream
+from modules.filter_bank import FilterBank
+from threading import Thread, Lock
+from collections import deque
+from time import sleep
+import numpy as np
+
+
+class StreamGroup:
+    def __init__(self, muse_streams: list[MuseStream], filter_bank: FilterBank = None, poll: float = 0.005):
+        self.streams = {muse_stream.type: muse_stream for muse_stream in muse_streams}
+        self.filter_bank = filter_bank
+        # * Filter designs can change from another thread between two passes
+        self.lock = Lock()
+        self.rate = max(muse_stream.sfreq for muse_stream in self.streams.values())
+        # * Sleep between two passes over the inlets when none of them had samples
+        self.poll = poll
+        self.started = False
+        self.chunks = {stream_type: 0 for stream_type in self.streams}
+        # * Raw chunks waiting for their filtered samples, the filter bank lines
+        # * up the streams of a group before filtering them together
+        self.waiting = {stream_type: deque() for stream_type in self.streams}
+        self.samples = {stream_type: 0 for stream_type in self.streams}
+
+    def __getitem__(self, stream_type: str):
+        return self.streams[stream_type]
+
+    def __contains__(self, stream_type: str):
+        return stream_type in self.streams
+
+    def pull_all(self, timeout: float = 0.0):
+        # * Read every inlet in one pass, filter all of them together and store
+        # * the chunks in their windows
+        chunks = {}
+        for stream_type, muse_stream in self.streams.items():
+            samples, timestamps = muse_stream.read(timeout)
+            if len(timestamps):
+                chunks[stream_type] = (np.asarray(samples, dtype=np.float64), timestamps)
+
+        for stream_type, (samples, timestamps) in chunks.items():
+            self.chunks[stream_type] += 1
+            self.samples[stream_type] += len(timestamps)
+            if self.filter_bank is None or stream_type not in self.filter_bank.streams:
+                self.streams[stream_type].push(samples, timestamps)
+            else:
+                # * The gap found by read() belongs to this chunk, not to the next push
+                self.waiting[stream_type].append((samples, timestamps, self.streams[stream_type].gap))
+
+        if self.filter_bank is not None and chunks:
+            with self.lock:
+                for stream_type in chunks:
+                    muse_stream = self.streams[stream_type]
+                    if muse_stream.gap and muse_stream.gaps.is_long(muse_stream.gap):
+                        self.filter_bank.reset(stream_type)
+                filtered = self.filter_bank.process({t: samples for t, (samples, _) in chunks.items()})
+            self.push_filtered(filtered)
+        return chunks
+
+    def push_filtered(self, filtered: dict):
+        # * Store the filtered samples next to the raw ones they came from
+        for stream_type, filt_samples in filtered.items():
+            muse_stream = self.streams[stream_type]
+            waiting = self.waiting[stream_type]
+            start = 0
+            while start < len(filt_samples):
+                samples, timestamps, gap = waiting[0]
+                k = min(len(timestamps), len(filt_samples) - start)
+                muse_stream.gap = gap
+                muse_stream.push(samples[:k], timestamps[:k], filt_samples[start : start + k])
+                if k == len(timestamps):
+                    waiting.popleft()
+                else:
+                    waiting[0] = (samples[k:], timestamps[k:], 0)
+                start += k
+
+    def flush(self):
+        # * The streams ended, the samples still lined up for filtering are stored
+        if self.filter_bank is not None:
+            with self.lock:
+                filtered = self.filter_bank.flush()
+            self.push_filtered(filtered)
+
+    def configure(self, stream_type: str, btype: str = None, cutoff=None, order: int = None):
+        # * Change the filter of one stream while running, its state is kept
+        with self.lock:
+            self.filter_bank.configure(stream_type, btype, cutoff, order)
+            return self.filter_bank.streams[stream_type]["design"]
+
+    def run(self):
+        # * A blocking pull on one inlet would delay all the others, every pass
+        # * takes whatever is already there and only sleeps when nothing was
+        while self.started:
+            if not self.pull_all():
+                if all(muse_stream.finished for muse_stream in self.streams.values()):
+                    self.flush()
+                    self.started = False
+                else:
+                    sleep(self.poll)
+
+    def start(self):
+        self.started = True
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.started = False
+        if getattr(self, "thread", None) is not None:
+            self.thread.join()
+
+    def window(self, stream_type: str):
+        # * Copy of the received part of a window (times, raw samples), safe to
+        # * take while the group thread pushes
+        muse_stream = self.streams[stream_type]
+        with muse_stream.lock:
+            n = muse_stream.valid
+            return muse_stream.times_buffer.latest(n).copy(), muse_stream.data_buffer.latest(n).copy()
+
+    def timeline(self, duration: float, rate: float = None, types: list[str] = None, windows: dict = None):
+        # * Common time grid covered by all the streams, ending at the oldest
+        # * of their last samples so no stream has to be extrapolated
+        types = types or list(self.streams)
+        rate = rate or self.rate
+        windows = windows or {stream_type: self.window(stream_type) for stream_type in types}
+        start, end = -np.inf, np.inf
+        for stream_type in types:
+            times = windows[stream_type][0]
+            if len(times) == 0:
+                return np.empty(0)
+            start = max(start, times[0])
+            end = min(end, times[-1])
+        start = max(start, end - duration)
+        if end < start:
+            return np.empty(0)
+        return end - np.arange(int((end - start) * rate) + 1)[::-1] / rate
+
+    def aligned(self, duration: float, rate: float = None, types: list[str] = None):
+        # * Resample the streams onto the common timeline (linear interpolation
+        # * over the real LSL timestamps), returns the grid and one array per type
+        types = types or list(self.streams)
+        windows = {stream_type: self.window(stream_type) for stream_type in types}
+        grid = self.timeline(duration, rate, types, windows)
+        if len(grid) == 0:
+            return grid, {stream_type: np.empty((0, self.streams[stream_type].n_chan)) for stream_type in types}
+        data = {}
+        for stream_type in types:
+            times, values = windows[stream_type]
+            data[stream_type] = np.column_stack(
+                [np.interp(grid, times, values[:, ii]) for ii in range(values.shape[1])]
+            )
+        return grid, data
+
+    def __str__(self):
+        return "\n".join(
+            f"StreamGroup [{stream_type}]: {self.chunks[stream_type]} chunks, {self.samples[stream_type]} samples"
+            for stream_type in self.streams
+        )
@@ -0,0 +1,67 @@
+from modules.constants import TOGGLE_CELESTINO, TOGGLE_SOSTENUTO, GYRO_AXIS, GYRO_SFREQ, CALIBRATION_TIME, CALIBRATION_SETTLE, DEFAULT_THRESHOLD
+from modules.recording import ReplayInlet, make_info, stream_paths, save_labels
+import numpy as np
+import json
+import os
+
+GYRO_CHANNELS = ["X", "Y", "Z"]
+
+
+class SyntheticInlet(ReplayInlet):
+    def __init__(self, duration: float, sfreq: float = GYRO_SFREQ, gesture_every: float = 3.0, realtime: bool = False, seed: int = 0, noise: float = 2.0, reversals: bool = False):
+        # * Still head with sensor noise (std `noise`) plus head nods on the Y
+        # * axis. Each nod is followed by a smaller movement back to rest with
+        # * the opposite sign. With `reversals`, halfway between two nods the
+        # * head also starts one as fast but turns back below the threshold
+        rng = np.random.default_rng(seed)
+        n = int(duration * sfreq)
+        self.header = {
+            "name": "Synthetic",
+            "type": "GYRO",
+            "source_id": "synthetic",
+            "sfreq": sfreq,
+            "n_chan": len(GYRO_CHANNELS),
+            "ch_names": GYRO_CHANNELS,
+        }
+        self.stream_info = make_info(self.header)
+        self.times = np.arange(n) / sfreq
+        self.data = rng.normal(0, noise, size=(n, len(GYRO_CHANNELS))) + rng.normal(0, 3, size=len(GYRO_CHANNELS))
+
+        # * (onset timestamp, action) of every generated gesture, and of every
+        # * aborted one that must not toggle a pedal
+        self.gestures = []
+        self.reversals = []
+        onset = CALIBRATION_SETTLE + CALIBRATION_TIME + 1
+        sign = 1
+        while onset + gesture_every < duration:
+            length = rng.uniform(0.2, 0.4)
+            amplitude = rng.uniform(80, 150)
+            self.add_pulse(onset, length, sign * amplitude, sfreq)
+            self.add_pulse(onset + length, 1.5 * length, -sign * amplitude / 3, sfreq)
+            self.gestures.append((onset, TOGGLE_CELESTINO if sign > 0 else TOGGLE_SOSTENUTO))
+            if reversals:
+                aborted = onset + gesture_every / 2
+                aborted_sign = rng.choice([-1, 1])
+                self.add_pulse(aborted, rng.uniform(0.08, 0.15), aborted_sign * rng.uniform(0.6, 0.95) * DEFAULT_THRESHOLD, sfreq)
+                self.reversals.append((aborted, TOGGLE_CELESTINO if aborted_sign > 0 else TOGGLE_SOSTENUTO))
+            onset += gesture_every + rng.uniform(-0.5, 0.5)
+            sign = -sign
+
+        self.realtime = realtime
+        self.position = 0
+        self.started_at = None
+
+    def save(self, folder: str):
+        # * Write the session as a labelled recording, same files as RecordingInlet
+        os.makedirs(folder, exist_ok=True)
+        header_path, data_path, times_path = stream_paths(folder, self.header["type"])
+        with open(header_path, "w") as f:
+            json.dump(self.header, f, indent=2)
+        np.asarray(self.data, dtype=np.float64).tofile(data_path)
+        np.asarray(self.times, dtype=np.float64).tofile(times_path)
+        save_labels(folder, self.gestures)
+
+    def add_pulse(self, onset: float, length: float, amplitude: float, sfreq: float):
+        start = int(onset * sfreq)
+        n = max(int(length * sfreq), 1)
+        self.data[start : start + n, GYRO_AXIS] += amplitude * np.sin(np.pi * np.arange(n) / n)
@@ -0,0 +1,30 @@
+from modules.constants import DEFAULT_NOISE_FACTOR, BASELINE_TIME_CONSTANT, MIN_THRESHOLD, FIXED, ADAPTIVE
+import numpy as np
+
+
+class AdaptiveThreshold:
+    def __init__(self, sfreq: float, noise_factor: float = DEFAULT_NOISE_FACTOR, time_constant: float = BASELINE_TIME_CONSTANT):
+        self.sfreq = sfreq
+        self.noise_factor = noise_factor
+        self.time_constant = time_constant
+        self.baseline = 0.0
+        self.std = 0.0
+
+    def calibrate(self, mean: float, std: float):
+        self.baseline = float(mean)
+        self.std = float(std)
+
+    @property
+    def level(self):
+        # * Trigger level in units of the calibration noise
+        return max(self.noise_factor * self.std, MIN_THRESHOLD)
+
+    def update(self, values):
+        # * Follow slow drift with an exponentially weighted baseline. Samples
+        # * beyond the trigger level are gestures and must not move it
+        values = np.asarray(values, dtype=np.float64)
+        rest = values[np.abs(values - self.baseline) < self.level]
+        if len(rest):
+            alpha = 1 - np.exp(-len(rest) / (self.sfreq * self.time_constant))
+            self.baseline += alpha * (rest.mean() - self.baseline)
+        return values - self.baseline
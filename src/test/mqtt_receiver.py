@@ -1,26 +1,51 @@
 import paho.mqtt.client as mqtt
-import json 
+from modules.constants import ACTIONS_TOPIC, MQTT_HOST, MQTT_PORT
+from modules.protocol import decode, one_way_latency, SequenceCheck
+import numpy as np
+import argparse
 
-# Callback cuando el cliente recibe un mensaje
-def on_message(client, userdata, msg):
-    payload = json.loads(msg.payload.decode())
+# * Listens to the actions like the pedal does and reports what it would drop.
+# * From src: PYTHONPATH=. python test/mqtt_receiver.py [--host ...] [--topic ...]
 
-    # 👉 Aquí va tu acción personalizada
-    if msg.topic == "mi/canal" and payload["action"] == "CHANGE_THRESHOLD":
-        print(f"✅ Threshold changed to {payload["value"]}")
-        # Aquí podrías activar un relé, encender un LED, enviar un comando, etc.
+sequences = SequenceCheck()
+latencies = []
 
-# Crear cliente MQTT
-client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
 
-# Asignar el callback de mensajes
-client.on_message = on_message
+def on_connect(client, userdata, flags, reason_code, properties):
+    print(f"Connected with result code {reason_code}")
+    client.subscribe(userdata["topic"], qos=1)
+
+
+def on_message(client, userdata, msg):
+    try:
+        code, boot, seq, sent_ms = decode(msg.payload)
+    except ValueError:
+        # * Plain string actions carry no sequence or time
+        print(f"✅ {msg.payload.decode(errors='replace')}")
+        return
+    new = sequences.check(boot, seq)
+    latency = one_way_latency(sent_ms)
+    latencies.append(latency)
+    print(f"{'✅' if new else '❌'} code {code} boot {boot:#06x} seq {seq} latency {latency} ms")
 
-# Conectarse al broker (por ejemplo, test.mosquitto.org o tu broker local)
-client.connect("test.mosquitto.org", 1883, 60)
 
-# Suscribirse a un tópico
-client.subscribe("mi/canal")
+parser = argparse.ArgumentParser()
+parser.add_argument("--host", default=MQTT_HOST)
+parser.add_argument("--port", type=int, default=MQTT_PORT)
+parser.add_argument("--topic", default=ACTIONS_TOPIC)
+args = parser.parse_args()
 
-# Iniciar loop de recepción de mensajes (bloqueante)
-client.loop_forever()
+client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, userdata={"topic": args.topic})
+client.on_connect = on_connect
+client.on_message = on_message
+client.connect(args.host, args.port, 60)
+try:
+    client.loop_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    print(sequences)
+    if latencies:
+        # * Wrapped (negative) values mean the clocks aren't synchronised
+        p50, p95, p99 = np.percentile(np.array(latencies), [50, 95, 99])
+        print(f"One-way latency (ms): p50 {p50:.1f}  p95 {p95:.1f}  p99 {p99:.1f}")
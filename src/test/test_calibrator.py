@@ -0,0 +1,31 @@
+from modules.calibrator import Calibrator
+import numpy as np
+import pytest
+
+SFREQ = 52
+
+
+@pytest.mark.parametrize("chunk", [1, 12, 100])
+def test_statistics_of_the_calibration_window(chunk):
+    # * Only the samples between `settle` and `settle + duration` after the
+    # * first one count, whatever the chunking
+    rng = np.random.default_rng(0)
+    timestamps = 100 + np.arange(10 * SFREQ) / SFREQ
+    samples = rng.normal([5, -3, 800], [1, 2, 4], size=(len(timestamps), 3))
+    calibrator = Calibrator(3, duration=5, settle=1)
+    calibrator.start()
+    done = []
+    for start in range(0, len(timestamps), chunk):
+        done.append(calibrator.update(samples[start : start + chunk], timestamps[start : start + chunk]))
+    used = samples[(timestamps >= 101) & (timestamps < 106)]
+    assert done.count(True) == 1
+    assert not calibrator.running
+    assert calibrator.count == len(used)
+    assert np.allclose(calibrator.mean, used.mean(axis=0), rtol=0, atol=1e-9)
+    assert np.allclose(calibrator.std, used.std(axis=0, ddof=1), rtol=0, atol=1e-9)
+
+
+def test_idle_until_started():
+    calibrator = Calibrator(3)
+    assert not calibrator.update(np.zeros((10, 3)), np.arange(10.0))
+    assert calibrator.count == 0
@@ -0,0 +1,40 @@
+from modules.decimator import follow
+from modules.muse_stream import MuseStream
+from modules.recording import ReplayInlet
+from modules.synthetic import SyntheticInlet
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def muse_stream(tmp_path):
+    SyntheticInlet(30, seed=0).save(str(tmp_path))
+    replay = ReplayInlet(str(tmp_path), "GYRO", realtime=False)
+    return MuseStream(replay.info(), False, 1, 5, inlet=replay)
+
+
+def test_snapshot_since_copies_only_the_new_samples(muse_stream):
+    for _ in range(30):
+        muse_stream.pull()
+    times, _ = muse_stream.snapshot()
+    muse_stream.pull()
+    new_times, new_source, n = muse_stream.snapshot_since(times[-1])
+    assert n == len(times) and len(new_times) == 12
+    all_times, all_source = muse_stream.snapshot()
+    assert np.array_equal(new_times, all_times[-12:]) and np.array_equal(new_source, all_source[-12:])
+    # * More than a window later the decimator has to start over
+    for _ in range(30):
+        muse_stream.pull()
+    assert muse_stream.snapshot_since(times[-1]) is None
+
+
+def test_follow_keeps_the_decimator_while_it_fits(muse_stream):
+    # * 5 s window at 52 Hz: full after 22 chunks of 12
+    for _ in range(25):
+        muse_stream.pull()
+    decimator = follow(None, muse_stream, 100)
+    for _ in range(10):
+        muse_stream.pull()
+        assert follow(decimator, muse_stream, 100) is decimator
+        assert decimator.last_time == muse_stream.snapshot()[0][-1]
+    assert follow(decimator, muse_stream, 200) is not decimator
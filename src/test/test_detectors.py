@@ -0,0 +1,87 @@
+from modules.gesture_detector import GestureDetector, ARMED
+from modules.predictive import PredictiveDetector
+from modules.synthetic import SyntheticInlet
+from modules.constants import GYRO_AXIS, DEFAULT_THRESHOLD, TOGGLE_CELESTINO
+import numpy as np
+import pytest
+
+SFREQ = 52
+
+
+def run(detector, values, timestamps, chunk: int, threshold: float = DEFAULT_THRESHOLD):
+    detections = []
+    for start in range(0, len(values), chunk):
+        detections += detector.update_chunk(values[start : start + chunk], timestamps[start : start + chunk], threshold)
+    return [(d.action, round(d.timestamp, 6), d.cancel) for d in detections]
+
+
+def make_detector(kind, noise: float = 2.0):
+    detector = kind()
+    if kind is PredictiveDetector:
+        detector.calibrate(noise)
+    return detector
+
+
+@pytest.fixture(scope="module")
+def session():
+    inlet = SyntheticInlet(120, seed=3)
+    values = inlet.data[:, GYRO_AXIS] - inlet.data[: 5 * SFREQ, GYRO_AXIS].mean()
+    return values, inlet.times, inlet.gestures
+
+
+@pytest.mark.parametrize("kind", [GestureDetector, PredictiveDetector])
+def test_same_detections_for_any_chunk_size(kind, session):
+    values, timestamps, _ = session
+    expected = run(make_detector(kind), values, timestamps, 1)
+    assert expected
+    for chunk in (5, 12, 64, 1000):
+        assert run(make_detector(kind), values, timestamps, chunk) == expected
+
+
+def first_after(detections, gestures):
+    # * Time of the first detection of every gesture, None if it was missed
+    times = []
+    for onset, action in gestures:
+        times.append(next((t for a, t, cancel in detections if a == action and not cancel and 0 <= t - onset < 1), None))
+    return times
+
+
+def test_predictive_finds_every_gesture_first(session):
+    values, timestamps, gestures = session
+    predictive = run(make_detector(PredictiveDetector), values, timestamps, 12)
+    plain = run(make_detector(GestureDetector), values, timestamps, 12)
+    assert [action for action, _, cancel in predictive if not cancel] == [action for _, action in gestures]
+    for early, late in zip(first_after(predictive, gestures), first_after(plain, gestures)):
+        assert early is not None and late is not None and early <= late
+
+
+@pytest.mark.parametrize("noise", [2.0, 4.0, 6.0])
+def test_still_head_never_fires(noise):
+    rng = np.random.default_rng(0)
+    timestamps = np.arange(300 * SFREQ) / SFREQ
+    values = rng.normal(0, noise, len(timestamps))
+    for kind in (GestureDetector, PredictiveDetector):
+        assert run(make_detector(kind, noise), values, timestamps, 12) == []
+
+
+def test_predictive_cancels_a_reversal():
+    # * Fast rise that turns back before the threshold: fired, then undone and
+    # * the pedal is armed again
+    timestamps = np.arange(2 * SFREQ) / SFREQ
+    values = np.zeros(len(timestamps))
+    bump = np.array([0, 8, 16, 24, 30, 32, 30, 24, 16, 8])
+    values[SFREQ : SFREQ + len(bump)] = bump
+    detector = make_detector(PredictiveDetector, noise=1.0)
+    detections = run(detector, values, timestamps, 12)
+    assert [(action, cancel) for action, _, cancel in detections] == [(TOGGLE_CELESTINO, False), (TOGGLE_CELESTINO, True)]
+    assert all(pedal.state == ARMED for pedal in detector.pedals)
+
+
+def test_uncalibrated_predictive_waits_for_the_threshold(session):
+    values, timestamps, _ = session
+    detector = PredictiveDetector()
+    detections = []
+    for start in range(0, len(values), 12):
+        detections += detector.update_chunk(values[start : start + 12], timestamps[start : start + 12], DEFAULT_THRESHOLD)
+    assert detections
+    assert all(d.confidence == 1.0 and not d.cancel for d in detections)
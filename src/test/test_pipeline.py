@@ -0,0 +1,20 @@
+from modules.pipeline import Derivative
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("span", [2, 5])
+def test_derivative_is_chunk_invariant(span):
+    rng = np.random.default_rng(0)
+    x = np.cumsum(rng.normal(size=(500, 3)), axis=0)
+    whole = Derivative(52.0, span).process(x)
+    derivative = Derivative(52.0, span)
+    chunked = np.vstack([derivative.process(x[start : start + 7]) for start in range(0, len(x), 7)])
+    assert np.allclose(whole, chunked)
+
+
+def test_derivative_of_a_ramp():
+    # * 2 units per sample at 52 Hz, once the span is filled with real samples
+    times = np.arange(100) / 52.0
+    derivative = Derivative(52.0, 5)
+    assert np.allclose(derivative.process(2 * np.arange(100.0), times)[4:], 104.0)
@@ -0,0 +1,82 @@
+from modules.protocol import parse_settings, BinaryProtocol, SequenceCheck, decode, state_topics
+from modules.constants import TOGGLE_CELESTINO, TOGGLE_SOSTENUTO, SET_CELESTINO_ON, SET_CELESTINO_OFF
+import json
+import pytest
+
+
+@pytest.mark.parametrize(
+    "payload, expected",
+    [
+        ({"action": "CHANGE_THRESHOLD", "value": 55}, ("CHANGE_THRESHOLD", 55)),
+        ({"action": "CHANGE_THRESHOLD", "value": "30"}, ("CHANGE_THRESHOLD", 30)),
+        ({"action": "DEFAULT_THRESHOLD"}, ("DEFAULT_THRESHOLD", None)),
+        ({"action": "CALIBRATE", "value": 1}, ("CALIBRATE", None)),
+        ({"action": "THRESHOLD_MODE", "value": "ADAPTIVE"}, ("THRESHOLD_MODE", "ADAPTIVE")),
+        ({"action": "CHANGE_NOISE_FACTOR", "value": 4.5}, ("CHANGE_NOISE_FACTOR", 4.5)),
+    ],
+)
+def test_parse_settings(payload, expected):
+    assert parse_settings(json.dumps(payload).encode()) == expected
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        b"not json",
+        b"\xff\xfe",
+        b"[1, 2]",
+        json.dumps({"action": "REBOOT"}).encode(),
+        json.dumps({"action": "CHANGE_THRESHOLD"}).encode(),
+        json.dumps({"action": "CHANGE_THRESHOLD", "value": "high"}).encode(),
+        json.dumps({"action": "CHANGE_THRESHOLD", "value": -5}).encode(),
+        json.dumps({"action": "CHANGE_NOISE_FACTOR", "value": 0}).encode(),
+        json.dumps({"action": "CHANGE_THRESHOLD", "value": True}).encode(),
+        json.dumps({"action": "CHANGE_NOISE_FACTOR", "value": "nan"}).encode(),
+        b'{"action": "CHANGE_THRESHOLD", "value": 1e400}',
+        json.dumps({"action": "THRESHOLD_MODE", "value": "adaptive"}).encode(),
+        json.dumps({"action": "THRESHOLD_MODE", "value": 1}).encode(),
+    ],
+)
+def test_parse_settings_rejects(raw):
+    with pytest.raises(ValueError):
+        parse_settings(raw)
+
+
+def test_set_state_commands_follow_the_reported_state():
+    protocol = BinaryProtocol()
+    # * Retained state from before the run: the pedal is already down
+    protocol.report(TOGGLE_CELESTINO, True)
+    code, boot, seq, _ = decode(protocol.encode(TOGGLE_CELESTINO))
+    assert (code, boot, seq) == (SET_CELESTINO_OFF, protocol.boot, 1)
+    protocol.commit(TOGGLE_CELESTINO)
+    # * A stale report arriving before our command is echoed doesn't undo it
+    protocol.report(TOGGLE_CELESTINO, True)
+    assert protocol.states[TOGGLE_CELESTINO] is False
+    protocol.report(TOGGLE_CELESTINO, False)
+    assert decode(protocol.encode(TOGGLE_CELESTINO))[0] == SET_CELESTINO_ON
+
+
+def test_sequence_check_accepts_a_restarted_sender():
+    check = SequenceCheck()
+    first, second = BinaryProtocol(), BinaryProtocol()
+    second.boot = first.boot ^ 1
+    accepted = []
+    for protocol in (first, second):
+        for _ in range(3):
+            _, boot, seq, _ = decode(protocol.encode(TOGGLE_SOSTENUTO))
+            protocol.commit(TOGGLE_SOSTENUTO)
+            accepted.append(check.check(boot, seq))
+    accepted.append(check.check(boot, seq))
+    assert accepted == [True] * 6 + [False]
+    assert (check.restarts, check.repeated) == (1, 1)
+
+
+def test_state_topics():
+    assert state_topics("adaptative-pedal/actions") == {
+        "adaptative-pedal/celestina": TOGGLE_CELESTINO,
+        "adaptative-pedal/sostenuto": TOGGLE_SOSTENUTO,
+    }
+    assert set(state_topics("adaptative-pedal/abc/actions")) == {
+        "adaptative-pedal/abc/celestina",
+        "adaptative-pedal/abc/sostenuto",
+    }
@@ -0,0 +1,36 @@
+from modules.recording import RecordingInlet, ReplayInlet
+from modules.synthetic import SyntheticInlet
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def session(tmp_path):
+    folder = tmp_path / "session"
+    SyntheticInlet(5, seed=0).save(str(folder))
+    return str(folder)
+
+
+def test_recording_round_trip(session, tmp_path):
+    folder = str(tmp_path / "copy")
+    recording = RecordingInlet(ReplayInlet(session, "GYRO", realtime=False), folder, ["x", "y", "z"])
+    while not recording.finished:
+        recording.pull_chunk(max_samples=12)
+    recording.close()
+    original, copy = ReplayInlet(session, "GYRO"), ReplayInlet(folder, "GYRO")
+    assert np.array_equal(original.data, copy.data) and np.array_equal(original.times, copy.times)
+
+
+def test_recording_refuses_an_older_run(session):
+    with pytest.raises(FileExistsError):
+        RecordingInlet(ReplayInlet(session, "GYRO"), session, ["x", "y", "z"])
+
+
+def test_realtime_replay_fills_the_chunks(session):
+    # * 12 samples are due every 0.23 s: a 1 s timeout always gets a full chunk
+    replay = ReplayInlet(session, "GYRO")
+    replay.times, replay.data = replay.times[:60], replay.data[:60]
+    sizes = []
+    while not replay.finished:
+        sizes.append(len(replay.pull_chunk(timeout=1.0, max_samples=12)[1]))
+    assert sizes == [12] * 5
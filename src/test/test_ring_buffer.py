@@ -0,0 +1,25 @@
+from modules.ring_buffer import RingBuffer
+import numpy as np
+
+
+def test_latest_after_wraps():
+    rng = np.random.default_rng(0)
+    ring = RingBuffer(50, 3)
+    reference = np.zeros((50, 3))
+    for k in rng.integers(1, 80, size=200):
+        chunk = rng.normal(size=(k, 3))
+        ring.append(chunk)
+        reference = np.vstack([reference, chunk])[-50:]
+        assert np.array_equal(ring.latest(), reference)
+        assert np.array_equal(ring.latest(7), reference[-7:])
+        assert np.array_equal(ring.last(), reference[-1])
+
+
+def test_resize_keeps_the_latest_samples():
+    ring = RingBuffer(10)
+    ring.append(np.arange(25))
+    ring.resize(4)
+    assert np.array_equal(ring.latest(), [21, 22, 23, 24])
+    ring.resize(8)
+    ring.append([25, 26])
+    assert np.array_equal(ring.latest(), [21, 22, 23, 24, 25, 26])
@@ -0,0 +1,28 @@
+from modules.ring_buffer import RingBuffer
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("offset", [0.0, 10.0, 1e4])
+def test_rolling_stats_match_nanstd(offset):
+    # * NaN chunks (long gaps) and resizes, compared against an exact
+    # * recomputation over the window after every append. The error grows with
+    # * the magnitude of the values: 1e-12 up to an offset of 100
+    rng = np.random.default_rng(1)
+    ring = RingBuffer(300, 4)
+    stats = ring.track_stats()
+    worst = 0.0
+    for step in range(400):
+        k = int(rng.integers(1, 40))
+        chunk = offset + rng.normal(0, 3, size=(k, 4))
+        if step % 37 == 0:
+            chunk[:, 1] = np.nan
+        ring.append(chunk)
+        if step == 150:
+            ring.resize(120)
+        if step == 250:
+            ring.resize(500)
+        window = ring.latest()
+        worst = max(worst, np.nanmax(np.abs(stats.std - np.nanstd(window, axis=0))))
+        worst = max(worst, np.nanmax(np.abs(stats.mean - np.nanmean(window, axis=0))))
+    assert worst < 1e-14 * max(offset, 100)
@@ -0,0 +1,76 @@
+from modules.shared_ring import SharedRing, SharedStream
+import numpy as np
+import pytest
+import os
+
+
+def meta(capacity: int = 64):
+    return {
+        "name": "Test", "type": "GYRO", "sfreq": 52.0, "n_chan": 3, "ch_names": ["X", "Y", "Z"],
+        "filt": False, "capacity": capacity, "window": 1,
+    }
+
+
+@pytest.fixture
+def ring():
+    writer = SharedRing.create(f"pedal-test-{os.getpid()}", meta())
+    yield writer
+    writer.close()
+
+
+def stamped(first: int, k: int):
+    # * Every sample carries its own index, torn or lost samples show up
+    times = np.arange(first, first + k, dtype=np.float64)
+    return times, np.repeat(times[:, None], 3, axis=1)
+
+
+def test_every_sample_arrives_once(ring):
+    reader = SharedRing(ring.shm, ring.meta, owner=False)
+    stream = SharedStream(reader, window=1)
+    received = []
+    written = 0
+    rng = np.random.default_rng(0)
+    for k in rng.integers(1, 40, size=200):
+        ring.append(*stamped(written, k))
+        written += k
+        samples, times = stream.pull(timeout=0)
+        assert np.array_equal(samples[:, 0], times)
+        received.append(times)
+    assert np.array_equal(np.concatenate(received), np.arange(written))
+
+
+def test_snapshot_is_a_copy(ring):
+    reader = SharedRing(ring.shm, ring.meta, owner=False)
+    ring.append(*stamped(0, 10))
+    times, data, _, written = reader.snapshot(5)
+    ring.append(*stamped(10, 100))
+    assert written == 10
+    assert np.array_equal(times, np.arange(5, 10))
+    assert np.array_equal(data[:, 1], times)
+
+
+def test_reader_arrays_are_read_only(ring):
+    reader = SharedRing(ring.shm, ring.meta, owner=False)
+    for array in (reader.header, reader.offsets, reader.times, reader.data, reader.data_f):
+        with pytest.raises(ValueError):
+            array[0] = 1
+
+
+def test_snapshot_gives_up_on_a_dead_writer(ring):
+    ring.append(*stamped(0, 10))
+    # * As if the writer died between the two increments of `seq`
+    ring.header[0] += 1
+    with pytest.raises(TimeoutError):
+        ring.snapshot(timeout=0.05)
+
+
+def test_shared_snapshot_since(ring):
+    shared_stream = SharedStream(SharedRing(ring.shm, ring.meta, owner=False))
+    ring.append(*stamped(0, 40))
+    times, _ = shared_stream.snapshot()
+    assert np.array_equal(times, np.arange(40))
+    ring.append(*stamped(40, 10))
+    new_times, data, n = shared_stream.snapshot_since(times[-1])
+    assert np.array_equal(new_times, np.arange(40, 50)) and n == 50
+    ring.append(*stamped(50, 100))
+    assert shared_stream.snapshot_since(new_times[-1]) is None
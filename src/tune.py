@@ -0,0 +1,157 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from time import perf_counter
+import numpy as np
+import argparse
+import tempfile
+import os
+from modules.constants import DEFAULT_THRESHOLD, REFRACTORY_PERIOD, REBOUND_PERIOD, GYRO_AXIS
+from modules.gesture_detector import GestureDetector
+from modules.calibrator import Calibrator
+from modules.recording import ReplayInlet, load_labels
+from modules.synthetic import SyntheticInlet
+
+# * Samples per update_chunk call. The detector decisions only depend on the
+# * timestamps, so they are the same as with live 12 sample chunks, bigger
+# * chunks just mean fewer calls
+TUNE_CHUNK = 256
+# * A detection counts for a gesture up to this long after its onset
+MATCH_WINDOW = 1.0
+
+# * Per worker process: [(times, values - calibration mean, labels)]
+sessions = []
+
+
+def load_sessions(folders: list[str]):
+    # * Runs once in every worker, the recordings are memory mapped
+    sessions.clear()
+    for folder in folders:
+        inlet = ReplayInlet(folder, "GYRO", realtime=False)
+        times = np.asarray(inlet.times)
+        data = np.asarray(inlet.data)
+        # * Same calibration as a live run, detection starts once it is over
+        calibrator = Calibrator(data.shape[1])
+        calibrator.start()
+        calibrator.update(data, times)
+        start = int(np.searchsorted(times, calibrator.started_at + calibrator.duration))
+        sessions.append((times[start:], data[start:] - calibrator.mean, load_labels(folder)))
+
+
+def score(labels, detections, max_delay: float = MATCH_WINDOW):
+    # * Greedy in time order: every gesture takes the first unused detection of
+    # * the same pedal inside its window
+    by_action = {}
+    for detection in detections:
+        by_action.setdefault(detection.action, []).append(detection.timestamp)
+    next_free = {action: 0 for action in by_action}
+    latencies = []
+    for onset, action in labels:
+        times = by_action.get(action, [])
+        ii = max(next_free.get(action, 0), int(np.searchsorted(times, onset)))
+        if ii < len(times) and times[ii] - onset <= max_delay:
+            latencies.append(times[ii] - onset)
+            next_free[action] = ii + 1
+    hits = len(latencies)
+    return hits, len(detections) - hits, len(labels) - hits, latencies
+
+
+def evaluate(configs):
+    results = []
+    for threshold, refractory, rebound, channel in configs:
+        channel = int(channel)
+        hits = false = missed = 0
+        latencies = []
+        for times, values, labels in sessions:
+            detector = GestureDetector(refractory, rebound)
+            detections = []
+            for start in range(0, len(times), TUNE_CHUNK):
+                end = start + TUNE_CHUNK
+                detections += detector.update_chunk(values[start:end, channel], times[start:end], threshold)
+            h, f, m, lat = score(labels, detections)
+            hits, false, missed = hits + h, false + f, missed + m
+            latencies += lat
+        precision = hits / (hits + false) if hits + false else 0.0
+        recall = hits / (hits + missed) if hits + missed else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        p50, p95 = np.percentile(latencies, [50, 95]) * 1e3 if latencies else (np.nan, np.nan)
+        results.append((threshold, refractory, rebound, channel, precision, recall, f1, p50, p95, hits, false, missed))
+    return results
+
+
+def parse_grid(text: str):
+    # * "start:stop:step" (stop included) or "a,b,c"
+    if ":" in text:
+        start, stop, step = (float(v) for v in text.split(":"))
+        return list(np.round(np.arange(start, stop + step / 2, step), 6))
+    return [float(v) for v in text.split(",")]
+
+
+def row(result):
+    threshold, refractory, rebound, channel, precision, recall, f1, p50, p95, hits, false, missed = result
+    return (
+        f"{threshold:9.1f} {refractory:10.2f} {rebound:7.2f} {channel:7d} "
+        f"{precision:9.3f} {recall:6.3f} {f1:6.3f} {p50:8.1f} {p95:8.1f} {hits:5d} {false:5d} {missed:6d}"
+    )
+
+
+HEADER = "threshold refractory rebound channel precision recall     f1  p50(ms)  p95(ms)  hits false missed"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline sweep of the detection parameters over labelled recordings")
+    parser.add_argument("sessions", nargs="*", help="recorded session folders with a labels.json")
+    parser.add_argument("--synthetic", type=int, default=0, help="also generate this many labelled synthetic sessions")
+    parser.add_argument("--duration", type=float, default=300, help="length of each synthetic session (s)")
+    parser.add_argument("--thresholds", default="10:100:5")
+    parser.add_argument("--refractory", default="0.1:0.6:0.1")
+    parser.add_argument("--rebound", default="0.5:1.5:0.25")
+    parser.add_argument("--channels", default=str(GYRO_AXIS))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--csv", help="write every configuration to this file")
+    args = parser.parse_args()
+
+    # * Synthetic sessions only live as long as the sweep
+    with tempfile.TemporaryDirectory(prefix="pedal-tune-") as base:
+        folders = list(args.sessions)
+        if args.synthetic:
+            for seed in range(args.synthetic):
+                folder = os.path.join(base, f"synthetic-{seed}")
+                SyntheticInlet(args.duration, seed=seed).save(folder)
+                folders.append(folder)
+        if not folders:
+            parser.error("no sessions, give recorded folders or --synthetic N")
+
+        defaults = (DEFAULT_THRESHOLD, REFRACTORY_PERIOD, REBOUND_PERIOD, GYRO_AXIS)
+        configs = list(product(
+            parse_grid(args.thresholds), parse_grid(args.refractory), parse_grid(args.rebound),
+            [int(c) for c in parse_grid(args.channels)],
+        ))
+        configs.append(defaults)
+        batches = [batch for batch in np.array_split(np.array(configs, dtype=object), args.workers * 4) if len(batch)]
+
+        started = perf_counter()
+        results = []
+        with ProcessPoolExecutor(args.workers, initializer=load_sessions, initargs=(folders,)) as pool:
+            for batch_results in pool.map(evaluate, batches):
+                results += batch_results
+        elapsed = perf_counter() - started
+
+    current = results.pop()
+    results.sort(key=lambda r: (-r[6], r[7]))
+    print(f"{len(configs) - 1} configurations on {len(folders)} sessions in {elapsed:.2f} s ({args.workers} workers)")
+    print(HEADER)
+    for result in results[: args.top]:
+        print(row(result))
+    print("Current settings:")
+    print(row(current))
+
+    if args.csv:
+        with open(args.csv, "w") as f:
+            f.write(",".join(HEADER.split()) + "\n")
+            for result in results:
+                f.write(",".join(str(v) for v in result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
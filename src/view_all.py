@@ -0,0 +1,67 @@
+from pylsl import resolve_streams
+from modules.muse_stream import MuseStream
+from modules.stream_group import StreamGroup
+from modules.filter_bank import default_filter_bank
+from modules.constants import DISCOVERY_TIMEOUT
+import matplotlib.pyplot as plt
+from modules.group_viewer import GroupViewer
+import numpy as np
+import argparse
+
+# * Display scale and seconds on screen per stream type
+SCALES = {"EEG": 100, "ACC": 5, "GYRO": 20}
+WINDOWS = {"EEG": 1}
+
+
+def main():
+    # * Plots every stream of the headset. One StreamGroup thread pulls all the
+    # * inlets in the same pass, with their real LSL timestamps
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--window", type=int, default=10, help="seconds on screen for the motion streams")
+    parser.add_argument("--raw", action="store_true", help="don't filter, show the streams centred on their mean")
+    parser.add_argument("--eeg-band", type=float, nargs=2, default=(1, 40), metavar=("LOW", "HIGH"), help="EEG band (Hz)")
+    parser.add_argument("--eeg-order", type=int, default=4, help="EEG Butterworth order, [ and ] change it while running")
+    args = parser.parse_args()
+
+    print("Buscando streams...")
+    streams = resolve_streams(DISCOVERY_TIMEOUT)
+    if len(streams) == 0:
+        raise (RuntimeError("No streams found"))
+
+    muse_streams: list[MuseStream] = []
+    for stream in streams:
+        stream_type = stream.type()
+        if any(muse_stream.type == stream_type for muse_stream in muse_streams):
+            # * The group keeps one stream per type, i.e. one headset
+            print(f"Skipping another {stream_type} stream ({stream.source_id()})")
+            continue
+        muse_stream = MuseStream(stream, False, SCALES.get(stream_type, 20), WINDOWS.get(stream_type, args.window))
+        muse_streams.append(muse_stream)
+        print(muse_stream)
+        print("")
+
+    # * One filter bank for every stream: streams with the same design are lined
+    # * up and their channels go through a single sosfilt call
+    filter_bank = None
+    if not args.raw:
+        filter_bank = default_filter_bank(muse_streams, tuple(args.eeg_band), args.eeg_order)
+        for muse_stream in muse_streams:
+            muse_stream.filt = True
+    group = StreamGroup(muse_streams, filter_bank)
+    group.start()
+
+    # * Creating tbe canvas with all the plots we found in the stream
+    n_panels = len(group.streams) + ("GYRO" in group and "ACC" in group)
+    figure = "15x6"
+    figsize = np.int16(figure.split('x'))
+    fig, axes = plt.subplots(1, n_panels, figsize=figsize, squeeze=False)
+    group_viewer = GroupViewer(group, fig, axes[0])
+    try:
+        group_viewer.start()
+    finally:
+        group.stop()
+        print(group)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+from modules.shared_ring import SharedRing, SharedStream
+import matplotlib.pyplot as plt
+from modules.lsl_viewer import LSLViewer
+import numpy as np
+import argparse
+
+
+def main():
+    # * Plots a stream shared by `main.py --share NAME` from its own process, the
+    # * detector never waits for the drawing
+    parser = argparse.ArgumentParser()
+    parser.add_argument("name", help="name given to main.py --share")
+    parser.add_argument("--window", type=float, help="seconds on screen (default: the detector window)")
+    parser.add_argument("--scale", type=float, default=1)
+    args = parser.parse_args()
+
+    ring = SharedRing.attach(args.name)
+    shared_stream = SharedStream(ring, args.scale, args.window)
+    print(f"Attached to {args.name} [{shared_stream.type}], waiting for samples...")
+    shared_stream.wait()
+
+    figure = "15x6"
+    figsize = np.int16(figure.split('x'))
+    fig, axes = plt.subplots(1, figsize=figsize)
+    lsl_viewer = LSLViewer(shared_stream, fig, axes, shared_stream.means)
+    lsl_viewer.start()
+    ring.close()
+
+
+if __name__ == "__main__":
+    main()